@@ -0,0 +1,217 @@
+"""
+Searcharr
+Sonarr, Radarr & Readarr Telegram Bot
+Cache Helpers
+https://github.com/toddrob99/searcharr
+"""
+import asyncio
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+# Background library refreshes still running
+_refresh_tasks = set()
+
+
+class LibraryIndex(object):
+    """In-memory copy of an *arr library, indexed by an external id.
+
+    The first load blocks the caller. After that, once the TTL expires the
+    current (stale) copy keeps being served while a single background refresh
+    replaces it, so requests never wait on a full library download. Items
+    added through the bot are inserted directly instead of forcing a refresh.
+    """
+
+    def __init__(self, name, key, ttl, logger, retry_after=30):
+        self.name = name
+        self.key = key
+        self.ttl = ttl
+        self.logger = logger
+        self.retry_after = retry_after
+        self._items = {}
+        self._loaded = False
+        self._refreshed = 0
+        self._next_refresh = 0
+        self._refreshing = False
+
+    @property
+    def stale(self):
+        return time.monotonic() >= self._next_refresh
+
+    def internal_id(self, key):
+        # Return the *arr database id for an external id, or None if not in the library
+        return self._items.get(key, {}).get("id")
+
+    def values(self):
+        return list(self._items.values())
+
+    def add(self, record):
+        if isinstance(record, dict) and record.get(self.key):
+            self._items[record[self.key]] = record
+
+    def replace(self, records):
+        # Build the new index aside and swap it in, so readers never see a partial one
+        self._items = {x[self.key]: x for x in records or [] if x.get(self.key)}
+        self._loaded = True
+        self._refreshed = time.monotonic()
+        self._next_refresh = self._refreshed + self.ttl
+        self.logger.debug(f"Indexed {len(self._items)} items in the {self.name} cache")
+
+    def _start_refresh(self):
+        # Only called on the event loop, so no lock is needed
+        if self._refreshing:
+            return False
+        self._refreshing = True
+        return True
+
+    def _refresh_failed(self, e):
+        self.logger.warning(
+            f"Error refreshing the {self.name} cache; serving cached data for another {self.retry_after}s: {e}"
+        )
+        self._next_refresh = time.monotonic() + self.retry_after
+
+    def refresh(self, fetch):
+        self.logger.debug(f"Refreshing the {self.name} cache...")
+        self.replace(fetch())
+
+    async def aensure(self, fetch):
+        # Async callers: load on first use, then refresh in a background task
+        if not self._loaded:
+            await self.arefresh(fetch)
+        elif self.stale and self._start_refresh():
+            # The event loop only keeps a weak reference to tasks
+            task = asyncio.create_task(self._arefresh_locked(fetch))
+            _refresh_tasks.add(task)
+            task.add_done_callback(_refresh_tasks.discard)
+        return self
+
+    async def arefresh(self, fetch):
+        self.logger.debug(f"Refreshing the {self.name} cache...")
+        self.replace(await fetch())
+
+    async def _arefresh_locked(self, fetch):
+        try:
+            await self.arefresh(fetch)
+        except Exception as e:
+            self._refresh_failed(e)
+        finally:
+            self._refreshing = False
+
+
+def normalize_term(term):
+    # Case and whitespace differences should share one cache entry
+    return " ".join(str(term).lower().split())
+
+
+class LookupCache(object):
+    """Bounded LRU cache with a TTL for *arr lookup responses.
+
+    Entries are keyed on the normalized search term. Callers get a deep copy
+    so the add flows can't modify a cached response in place.
+    """
+
+    def __init__(self, name, maxsize, ttl, logger):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.logger = logger
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0 and self.ttl > 0
+
+    def get(self, term):
+        if not self.enabled:
+            return None
+        key = normalize_term(term)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                value = entry[1]
+            else:
+                if entry:
+                    del self._entries[key]
+                self.misses += 1
+                value = None
+        self.logger.debug(
+            f"{self.name} lookup cache {'hit' if value is not None else 'miss'} for [{key}] ({self.stats()})"
+        )
+        return copy.deepcopy(value)
+
+    def put(self, term, value):
+        if not self.enabled or value is None:
+            return
+        with self._lock:
+            key = normalize_term(term)
+            self._entries[key] = (time.monotonic() + self.ttl, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return f"hits={self.hits}, misses={self.misses}, size={len(self._entries)}"
+
+
+class LRUCache(object):
+    """Bounded least-recently-used mapping with hit, miss and eviction counters.
+
+    Values are stored and returned as-is, so callers that hand them out must
+    not let them be modified. Meant to be used from the event loop only.
+    """
+
+    def __init__(self, name, maxsize, logger):
+        self.name = name
+        self.maxsize = maxsize
+        self.logger = logger
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            evicted, _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            self.logger.debug(f"Evicted [{evicted}] from the {self.name} cache ({self.stats()})")
+
+    def peek(self, key):
+        # Look up without counting a hit or miss or refreshing recency
+        return self._entries.get(key)
+
+    def pop(self, key):
+        return self._entries.pop(key, None)
+
+    def keys(self):
+        return list(self._entries.keys())
+
+    def stats(self):
+        return f"hits={self.hits}, misses={self.misses}, evictions={self.evictions}, size={len(self._entries)}"
@@ -0,0 +1,162 @@
+"""
+Searcharr
+Sonarr, Radarr & Readarr Telegram Bot
+Conversation Helpers
+https://github.com/toddrob99/searcharr
+"""
+import json
+import string
+import time
+import zlib
+
+# Lookup result fields read by _prepare_response and the add flows; anything
+# else returned by Sonarr/Radarr/Readarr is dropped before it is stored.
+RESULT_FIELDS = {
+    "series": [
+        "title",
+        "year",
+        "seasonCount",
+        "network",
+        "status",
+        "overview",
+        "remotePoster",
+        "tvdbId",
+        "imdbId",
+        "tvRageId",
+        "titleSlug",
+        "genres",
+        "images",
+        "seasons",
+        "id",
+    ],
+    "movie": [
+        "title",
+        "year",
+        "runtime",
+        "status",
+        "overview",
+        "remotePoster",
+        "tmdbId",
+        "imdbId",
+        "titleSlug",
+        "images",
+        "id",
+    ],
+    "book": [
+        "title",
+        "author",
+        "seriesTitle",
+        "disambiguation",
+        "overview",
+        "remotePoster",
+        "releaseDate",
+        "foreignBookId",
+        "titleSlug",
+        "links",
+        "editions",
+        "id",
+    ],
+}
+NESTED_FIELDS = {
+    "seasons": ["seasonNumber", "monitored"],
+    "images": ["coverType", "url", "remoteUrl"],
+    "author": ["authorName", "foreignAuthorId"],
+}
+MAX_OVERVIEW = 1024  # Captions are cut at 1024 characters anyway
+
+# Digits, then upper, then lower case: the same order SQLite compares text in,
+# so fixed-width ids sort (and MAX() works) in the order they were issued
+CID_ALPHABET = string.digits + string.ascii_uppercase + string.ascii_lowercase
+CID_LENGTH = 7  # 62**7 milliseconds is over 100 years from the epoch
+
+
+def _pick(value, fields):
+    if isinstance(value, list):
+        return [_pick(x, fields) for x in value]
+    if isinstance(value, dict):
+        return {k: value[k] for k in fields if k in value}
+    return value
+
+
+def trim_results(kind, results):
+    fields = RESULT_FIELDS.get(kind)
+    if not fields:
+        return results
+
+    trimmed = []
+    for r in results:
+        t = {}
+        for k in fields:
+            if k not in r:
+                continue
+            v = r[k]
+            if k in NESTED_FIELDS:
+                v = _pick(v, NESTED_FIELDS[k])
+            elif k == "overview" and isinstance(v, str):
+                v = v[:MAX_OVERVIEW]
+            t[k] = v
+        trimmed.append(t)
+    return trimmed
+
+
+def encode(results):
+    # Compact JSON compressed with zlib and stored as a BLOB
+    data = json.dumps(results, separators=(",", ":"))
+    return zlib.compress(data.encode("utf-8"))
+
+
+def decode(value):
+    # Rows written before compression was added hold plain JSON text
+    if isinstance(value, bytes):
+        value = zlib.decompress(value).decode("utf-8")
+    return json.loads(value)
+
+
+class AddData(dict):
+    """Add data for one conversation, remembering which keys were set.
+
+    Values are stored as strings, the same as in the add_data table.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.changed = set()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, str(value))
+        self.changed.add(key)
+
+
+class CidGenerator(object):
+    """Generate conversation ids in-process without querying the database.
+
+    Ids are the current time in milliseconds, written as fixed-width base62,
+    and strictly increase: a second id in the same millisecond takes the next
+    value. Seeding with the largest id already stored keeps new ids unique
+    even if the clock has gone backwards since.
+    """
+
+    def __init__(self, last_cid=None):
+        self._last = self._decode(last_cid)
+
+    def _decode(self, cid):
+        if not cid or len(cid) != CID_LENGTH:
+            return 0
+        n = 0
+        for c in cid:
+            i = CID_ALPHABET.find(c)
+            if i < 0:
+                return 0
+            n = n * 62 + i
+        return n
+
+    def _encode(self, n):
+        chars = []
+        for _ in range(CID_LENGTH):
+            n, i = divmod(n, 62)
+            chars.append(CID_ALPHABET[i])
+        return "".join(reversed(chars))
+
+    def next(self):
+        self._last = max(int(time.time() * 1000), self._last + 1)
+        return self._encode(self._last)
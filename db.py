@@ -0,0 +1,331 @@
+"""
+Searcharr
+Sonarr, Radarr & Readarr Telegram Bot
+Database Helpers
+https://github.com/toddrob99/searcharr
+"""
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_TIMEOUT = 30
+DEFAULT_BATCH_SIZE = 64
+
+# Applied once to each pooled connection when it is opened
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",  # Safe with WAL; only the last commits can be lost on power failure
+    "PRAGMA cache_size = -8000;",  # 8 MB page cache per connection
+    "PRAGMA mmap_size = 67108864;",  # 64 MB memory-mapped reads
+    "PRAGMA temp_store = MEMORY;",
+]
+
+
+class ConnectionPool(object):
+    """Fixed-size pool of long-lived SQLite connections.
+
+    Connections are opened lazily (up to size), have the pragmas above applied
+    once, and are handed out exclusively via borrow(). A caller that can't get
+    a connection within timeout seconds gets a sqlite3.OperationalError, the
+    same as it would for a locked database.
+    """
+
+    def __init__(
+        self,
+        path,
+        logger,
+        size=DEFAULT_POOL_SIZE,
+        timeout=DEFAULT_TIMEOUT,
+    ):
+        self.path = path
+        self.logger = logger
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        for pragma in PRAGMAS:
+            con.execute(pragma)
+        self.logger.debug(f"Database connection established [{self.path}].")
+        return con
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except sqlite3.Error:
+                    self._opened -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f"Timed out after {self.timeout}s waiting for a database connection"
+            )
+
+    def _release(self, con):
+        if con.in_transaction:
+            # Don't hand an open transaction to the next borrower
+            con.rollback()
+        if self._closed:
+            con.close()
+        else:
+            self._idle.put(con)
+
+    @contextmanager
+    def borrow(self):
+        """Yield a (connection, cursor) tuple and return the connection afterwards."""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        con = self._acquire()
+        cur = con.cursor()
+        try:
+            yield con, cur
+        finally:
+            cur.close()
+            self._release(con)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class Writer(object):
+    """Run every database write on one dedicated thread and connection.
+
+    SQLite only allows one writer at a time anyway; funnelling writes through
+    a single thread means they never contend with each other for the database
+    lock, and readers (which use the pool) are never blocked by them under WAL.
+
+    Jobs are called as fn(con, cur, *args). Whatever has queued up while the
+    previous commit was running (up to batch_size jobs) is committed together
+    in one transaction, with a savepoint around each job so a failing job is
+    rolled back and re-raised to its caller without affecting the others.
+    Jobs submitted with transaction=False (e.g. VACUUM) run on their own,
+    outside any transaction, once the writes queued before them are committed.
+    """
+
+    def __init__(self, pool, batch_size=DEFAULT_BATCH_SIZE):
+        self.pool = pool
+        self.logger = pool.logger
+        self.batch_size = max(1, batch_size)
+        self.commits = 0
+        self.jobs = 0
+        self._jobs = queue.Queue()
+        # Opened here so a connection error surfaces at startup
+        self._con = pool._connect()
+        self._con.isolation_level = None  # Transactions are managed explicitly
+        self._thread = threading.Thread(
+            target=self._loop, name="searcharr-db-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, fn, *args, transaction=True):
+        # Queue a job and return a concurrent.futures.Future for its result
+        future = Future()
+        self._jobs.put((future, fn, args, transaction))
+        return future
+
+    def _loop(self):
+        con = self._con
+        cur = con.cursor()
+        stopping = False
+        while not stopping:
+            batch = []
+            standalone = None
+            job = self._jobs.get()
+            while job is not None:
+                future, fn, args, transaction = job
+                if not transaction:
+                    standalone = job
+                    break
+                if future.set_running_or_notify_cancel():
+                    batch.append(job)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    job = self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+            stopping = job is None
+            if batch:
+                self._commit_batch(con, cur, batch)
+            if standalone:
+                self._run_standalone(con, cur, standalone)
+        cur.close()
+        con.close()
+        self.logger.debug(
+            f"Database writer stopped after {self.jobs} writes in {self.commits} commits"
+        )
+
+    def _commit_batch(self, con, cur, batch):
+        results = []
+        try:
+            cur.execute("BEGIN;")
+            for future, fn, args, _ in batch:
+                cur.execute("SAVEPOINT job;")
+                try:
+                    results.append((future, True, fn(con, cur, *args)))
+                except Exception as e:
+                    cur.execute("ROLLBACK TO job;")
+                    results.append((future, False, e))
+                cur.execute("RELEASE job;")
+            cur.execute("COMMIT;")
+        except sqlite3.Error as e:
+            self.logger.error(f"Error committing a batch of {len(batch)} writes: {e}")
+            if con.in_transaction:
+                con.rollback()
+            for future, fn, args, _ in batch:
+                future.set_exception(e)
+            return
+
+        self.commits += 1
+        self.jobs += len(batch)
+        for future, ok, value in results:
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _run_standalone(self, con, cur, job):
+        future, fn, args, _ = job
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = fn(con, cur, *args)
+        except Exception as e:
+            if con.in_transaction:
+                con.rollback()
+            future.set_exception(e)
+        else:
+            self.jobs += 1
+            future.set_result(result)
+
+    def close(self):
+        # Finish the queued writes, then stop the thread
+        self._jobs.put(None)
+        self._thread.join()
+
+
+class Database(object):
+    """Awaitable access to the bot database.
+
+    Reads borrow a pooled connection on a worker thread; writes are queued to
+    the Writer. Either way the event loop only waits on a future.
+
+    Connections return plain tuples, which fetchone() and fetchall() turn into
+    dicts keyed by the cursor's column names.
+    """
+
+    def __init__(
+        self,
+        path,
+        logger,
+        pool_size=DEFAULT_POOL_SIZE,
+        batch_size=DEFAULT_BATCH_SIZE,
+    ):
+        self.pool = ConnectionPool(path, logger, pool_size)
+        self.writer = Writer(self.pool, batch_size)
+
+    async def read(self, fn, *args):
+        return await asyncio.to_thread(self._read, fn, *args)
+
+    def _read(self, fn, *args):
+        with self.pool.borrow() as (con, cur):
+            return fn(con, cur, *args)
+
+    async def fetchone(self, q, qa=()):
+        return await self.read(_fetchone, q, qa)
+
+    async def fetchall(self, q, qa=()):
+        return await self.read(_fetchall, q, qa)
+
+    async def write(self, fn, *args):
+        return await asyncio.wrap_future(self.writer.submit(fn, *args))
+
+    async def execute(self, q, qa=()):
+        return await self.write(_execute, q, qa)
+
+    async def maintain(self):
+        """Vacuum free pages, refresh query planner statistics and truncate the WAL.
+
+        Returns (before, after) dicts of the database and WAL file sizes.
+        """
+        return await asyncio.wrap_future(
+            self.writer.submit(_maintain, self.pool.path, transaction=False)
+        )
+
+    def close(self):
+        self.writer.close()
+        self.pool.close()
+
+
+def _file_stats(cur, path):
+    page_size = cur.execute("PRAGMA page_size;").fetchone()[0]
+    return {
+        "size": os.path.getsize(path),
+        "wal": os.path.getsize(f"{path}-wal") if os.path.exists(f"{path}-wal") else 0,
+        "free": cur.execute("PRAGMA freelist_count;").fetchone()[0] * page_size,
+    }
+
+
+def _maintain(con, cur, path):
+    before = _file_stats(cur, path)
+    if cur.execute("PRAGMA auto_vacuum;").fetchone()[0] != 2:
+        # Incremental vacuum only works once the database has been rebuilt
+        # with auto_vacuum set, so the first run does a full VACUUM
+        cur.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+        cur.execute("VACUUM;")
+    else:
+        cur.execute("PRAGMA incremental_vacuum;").fetchall()
+    if cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE name='sqlite_stat1';"
+    ).fetchone():
+        cur.execute("PRAGMA optimize;")
+    else:
+        cur.execute("ANALYZE;")
+    cur.execute("PRAGMA wal_checkpoint(TRUNCATE);").fetchall()
+    return before, _file_stats(cur, path)
+
+
+def _execute(con, cur, q, qa):
+    cur.execute(q, qa)
+    return cur.rowcount
+
+
+def _rows_to_dicts(cur, rows):
+    columns = tuple(x[0] for x in cur.description)
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def _fetchone(con, cur, q, qa):
+    row = cur.execute(q, qa).fetchone()
+    if row is None:
+        return None
+    return _rows_to_dicts(cur, [row])[0]
+
+
+def _fetchall(con, cur, q, qa):
+    rows = cur.execute(q, qa).fetchall()
+    if not rows:
+        return []
+    return _rows_to_dicts(cur, rows)
@@ -0,0 +1,127 @@
+"""
+Searcharr
+Sonarr, Radarr & Readarr Telegram Bot
+HTTP Session Helper
+https://github.com/toddrob99/searcharr
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = (5, 30)  # (connect, read) in seconds
+DEFAULT_MAX_RETRIES = 2
+
+
+def build_session(
+    pool_size=DEFAULT_POOL_SIZE, max_retries=DEFAULT_MAX_RETRIES, keep_alive=True
+):
+    # Each API wrapper talks to a single host, so one pool of up to pool_size
+    # keep-alive connections is shared by every request the wrapper makes.
+    # Only connection failures on idempotent GETs are retried.
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=0,
+        status=0,
+        backoff_factor=0.2,
+        allowed_methods=frozenset(["GET"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if not keep_alive:
+        session.headers["Connection"] = "close"
+    return session
+
+
+def normalize_timeout(timeout):
+    # Accept a single number or a (connect, read) pair from settings.py
+    if timeout is None:
+        return DEFAULT_TIMEOUT
+    if isinstance(timeout, (list, tuple)):
+        return tuple(timeout)
+    return (timeout, timeout)
+
+
+def parse_response(r):
+    # Shared by the requests (startup) and httpx (handlers) transports: raise
+    # on error statuses, otherwise return the decoded JSON body
+    if r.status_code not in [200, 201, 202, 204]:
+        r.raise_for_status()
+        return None
+    else:
+        return r.json()
+
+
+def build_async_client(
+    pool_size=DEFAULT_POOL_SIZE,
+    timeout=DEFAULT_TIMEOUT,
+    keep_alive=True,
+    max_retries=DEFAULT_MAX_RETRIES,
+    keepalive_expiry=30,
+):
+    connect, read = normalize_timeout(timeout)
+    limits = httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size if keep_alive else 0,
+        keepalive_expiry=keepalive_expiry,
+    )
+    # Follow redirects like the requests session used at startup does, so a
+    # proxy redirecting (e.g. http to https) works for handlers too
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(read, connect=connect),
+        follow_redirects=True,
+        transport=httpx.AsyncHTTPTransport(retries=max_retries, limits=limits),
+    )
+
+
+class SingleFlight(object):
+    """Share one outstanding call between concurrent callers with the same key.
+
+    The first caller runs the call; anyone asking for the same key while it is
+    still in flight waits for and receives the same result (or exception).
+    do() serves threads, ado() serves coroutines on the event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        if not leader:
+            return call.result()
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def ado(self, key, fn, *args):
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(fn(*args))
+            task.add_done_callback(lambda t: self._tasks.pop(key, None))
+        # Shield the shared task so one cancelled caller doesn't cancel it for the rest
+        return await asyncio.shield(task)
@@ -0,0 +1,240 @@
+"""
+Searcharr
+Sonarr, Radarr & Readarr Telegram Bot
+Database Migrations
+https://github.com/toddrob99/searcharr
+"""
+import os
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+import db
+
+
+class DryRun(Exception):
+    """Raised to roll back migrations that were only being tried out."""
+
+
+def _query(con, q, qa=()):
+    return con.execute(q, qa).fetchall()
+
+
+def _add_conversation_created_at(con, cur):
+    # Databases created before conversations expired lack created_at; start
+    # the clock on their existing conversations now
+    columns = [x[1] for x in _query(con, "PRAGMA table_info(conversations);")]
+    if "created_at" not in columns:
+        cur.execute("ALTER TABLE conversations ADD COLUMN created_at real;")
+        cur.execute("UPDATE conversations SET created_at=?;", (time.time(),))
+
+
+def _add_rate_limit_tokens(con, cur):
+    # Token buckets are saved as fractional tokens used; request_count and
+    # window_start keep their old meaning and are no longer read
+    columns = [x[1] for x in _query(con, "PRAGMA table_info(rate_limits);")]
+    if "tokens_used" not in columns:
+        cur.execute("ALTER TABLE rate_limits ADD COLUMN tokens_used REAL;")
+    if "tokens_saved_at" not in columns:
+        cur.execute("ALTER TABLE rate_limits ADD COLUMN tokens_saved_at TEXT;")
+
+
+# (version, description, steps), applied in order. A step is either an SQL
+# statement or a function called as fn(con, cur). Released migrations must
+# never change; add a new one instead. Index builds only block other writes
+# (readers carry on under WAL), and run before the bot starts taking updates.
+MIGRATIONS = [
+    (
+        1,
+        "Create tables",
+        [
+            """CREATE TABLE IF NOT EXISTS conversations (
+                id text primary key,
+                username text not null,
+                type text,
+                results text
+            );""",
+            """CREATE TABLE IF NOT EXISTS users (
+                id integer primary key,
+                username text not null,
+                admin text,
+                permissions text
+            );""",
+            """CREATE TABLE IF NOT EXISTS add_data (
+                cid text,
+                key text,
+                value text,
+                primary key (cid, key)
+            );""",
+            """CREATE TABLE IF NOT EXISTS request_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                username TEXT,
+                request_type TEXT NOT NULL,
+                title TEXT NOT NULL,
+                tmdb_id TEXT,
+                tvdb_id TEXT,
+                status TEXT DEFAULT 'pending',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );""",
+            """CREATE TABLE IF NOT EXISTS rate_limits (
+                user_id INTEGER PRIMARY KEY,
+                request_count INTEGER DEFAULT 0,
+                window_start TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );""",
+        ],
+    ),
+    (
+        2,
+        "Add created_at to conversations",
+        [_add_conversation_created_at],
+    ),
+    (
+        3,
+        "Index and roll up request history",
+        [
+            # Covers /myrequests (latest requests for a user) without touching the table
+            """CREATE INDEX IF NOT EXISTS idx_request_history_user_created
+                ON request_history (user_id, created_at, request_type, title, status);""",
+            # Requests per user, type and status per day; kept when old history is deleted
+            """CREATE TABLE IF NOT EXISTS request_history_daily (
+                day TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                request_type TEXT NOT NULL,
+                status TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, user_id, request_type, status)
+            ) WITHOUT ROWID;""",
+            """INSERT OR IGNORE INTO request_history_daily (day, user_id, request_type, status, count)
+                SELECT date(created_at), user_id, request_type, COALESCE(status, 'pending'), COUNT(*)
+                FROM request_history
+                GROUP BY 1, 2, 3, 4;""",
+        ],
+    ),
+    (
+        4,
+        "Cache Telegram file_ids for posters",
+        [
+            """CREATE TABLE IF NOT EXISTS poster_cache (
+                url TEXT PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );""",
+            """CREATE INDEX IF NOT EXISTS idx_poster_cache_updated
+                ON poster_cache (updated_at);""",
+        ],
+    ),
+    (
+        5,
+        "Index request history by age",
+        [
+            # Lets the retention job find old requests without scanning the table
+            """CREATE INDEX IF NOT EXISTS idx_request_history_created
+                ON request_history (created_at);""",
+        ],
+    ),
+    (
+        6,
+        "Store rate limit buckets in their own columns",
+        [_add_rate_limit_tokens],
+    ),
+]
+
+
+def _current_version(con, cur):
+    if not _query(
+        con, "SELECT 1 FROM sqlite_master WHERE type='table' AND name='schema_version';"
+    ):
+        return 0
+    return _query(con, "SELECT COALESCE(MAX(version), 0) FROM schema_version;")[0][0]
+
+
+def _apply(con, cur, migration):
+    version, description, steps = migration
+    cur.execute(
+        """CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );"""
+    )
+    for step in steps:
+        if callable(step):
+            step(con, cur)
+        else:
+            cur.execute(step)
+    cur.execute(
+        "INSERT INTO schema_version (version, description) VALUES (?, ?);",
+        (version, description),
+    )
+
+
+def _try_all(con, cur, migrations):
+    for migration in migrations:
+        _apply(con, cur, migration)
+    raise DryRun()
+
+
+async def migrate(database, logger, dry_run=False):
+    """Bring the schema up to date and return the versions applied.
+
+    Each migration is committed on its own together with its schema_version
+    row, so a failure leaves the database at the last good version. With
+    dry_run, the pending migrations are applied in one transaction that is
+    rolled back, so errors show up without anything being changed.
+    """
+    current = await database.read(_current_version)
+    pending = [x for x in MIGRATIONS if x[0] > current]
+    if not pending:
+        logger.debug(f"Database schema is up to date (version {current})")
+        return []
+
+    logger.info(
+        f"Database schema is at version {current}; {len(pending)} migrations pending"
+    )
+    for version, description, steps in pending:
+        logger.info(
+            f"{'Would apply' if dry_run else 'Applying'} migration {version}: {description}"
+        )
+        for step in steps:
+            logger.debug(f"Migration {version} step: {getattr(step, '__name__', step)}")
+        if dry_run:
+            continue
+        start = time.monotonic()
+        await database.write(_apply, (version, description, steps))
+        logger.info(
+            f"Applied migration {version} in {time.monotonic() - start:.2f}s"
+        )
+
+    if dry_run:
+        try:
+            await database.write(_try_all, pending)
+        except DryRun:
+            logger.info(
+                f"Dry run applied {len(pending)} migrations without errors; nothing was saved"
+            )
+    return [x[0] for x in pending]
+
+
+async def dry_run(path, logger):
+    # Try the pending migrations against a copy of the database at path. The
+    # pool would switch the file it opens to WAL, so the original is only
+    # read, through a plain read-only connection.
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = os.path.join(tmp, os.path.basename(path) or "searcharr.db")
+        if os.path.exists(path):
+            src = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+            dst = sqlite3.connect(copy)
+            try:
+                src.backup(dst)
+            finally:
+                dst.close()
+                src.close()
+        else:
+            logger.info(f"No database at [{path}]; trying migrations on an empty one")
+        database = db.Database(copy, logger, pool_size=1)
+        try:
+            await migrate(database, logger, dry_run=True)
+        finally:
+            database.close()
@@ -10,6 +10,7 @@ import requests
 from aiohttp import web
 from log import set_up_logger
 import plex_helper
+import ratelimit
 import settings as _settings
 
 logger = set_up_logger(__name__, False, False)
@@ -124,15 +125,22 @@ async def _handle_plex_webhook(request: web.Request, bot, admin_ids: list, event
         for uid in admin_ids:
             try:
                 if poster:
-                    await bot.send_photo(
+                    message = await bot.send_photo(
                         chat_id=int(uid),
                         photo=poster,
                         caption=text,
                         parse_mode="HTML",
+                        rate_limit_args={"priority": ratelimit.NOTIFICATION},
                     )
-                    poster.seek(0)  # reset for next recipient
+                    # Send the uploaded photo by file_id to the next recipients
+                    poster = message.photo[-1].file_id
                 else:
-                    await bot.send_message(chat_id=int(uid), text=text, parse_mode="HTML")
+                    await bot.send_message(
+                        chat_id=int(uid),
+                        text=text,
+                        parse_mode="HTML",
+                        rate_limit_args={"priority": ratelimit.NOTIFICATION},
+                    )
             except Exception as e:
                 logger.error(f"Failed to send Plex notification to {uid}: {e}")
 
@@ -142,12 +150,15 @@ async def _handle_plex_webhook(request: web.Request, bot, admin_ids: list, event
     return web.Response(status=200, text="OK")
 
 
-async def start_webhook_server(bot, admin_ids: list, port: int = 32401, events: set = None):
+def add_routes(app: web.Application, bot, admin_ids: list, events: set = None):
     if events is None:
         events = DEFAULT_EVENTS
+    app.router.add_post("/plex", lambda r: _handle_plex_webhook(r, bot, admin_ids, events))
+
 
+async def start_webhook_server(bot, admin_ids: list, port: int = 32401, events: set = None):
     app = web.Application()
-    app.router.add_post("/plex", lambda r: _handle_plex_webhook(r, bot, admin_ids, events))
+    add_routes(app, bot, admin_ids, events)
 
     runner = web.AppRunner(app)
     await runner.setup()
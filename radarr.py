@@ -9,12 +9,40 @@ import requests
 from urllib.parse import quote
 
 from log import set_up_logger
+import cache
+import http_helper
 
 
 class Radarr(object):
-    def __init__(self, api_url, api_key, verbose=False):
+    """Radarr API wrapper whose per-request methods are coroutines.
+
+    Version discovery, quality profiles, root folders and the first library
+    fetch are loaded synchronously by the constructor (before the bot starts
+    handling updates); everything a handler calls afterwards goes through an
+    httpx.AsyncClient so the event loop is never blocked on Radarr.
+    """
+
+    def __init__(
+        self,
+        api_url,
+        api_key,
+        verbose=False,
+        pool_size=http_helper.DEFAULT_POOL_SIZE,
+        timeout=http_helper.DEFAULT_TIMEOUT,
+        keep_alive=True,
+        max_retries=http_helper.DEFAULT_MAX_RETRIES,
+        library_ttl=300,
+        lookup_cache_size=256,
+        lookup_cache_ttl=600,
+    ):
         self.logger = set_up_logger("searcharr.radarr", verbose, False)
         self.logger.debug("Logging started!")
+        self._timeout = http_helper.normalize_timeout(timeout)
+        self._session = http_helper.build_session(pool_size, max_retries, keep_alive)
+        self._inflight = http_helper.SingleFlight()
+        self._lookup_cache = cache.LookupCache(
+            "Radarr", lookup_cache_size, lookup_cache_ttl, self.logger
+        )
         if api_url[-1] == "/":
             api_url = api_url[:-1]
         if api_url[:4] != "http":
@@ -26,6 +54,17 @@ class Radarr(object):
             self.api_url = api_url + "/api/v3/{endpoint}?apikey=" + api_key
         self._quality_profiles = self.get_all_quality_profiles()
         self._root_folders = self.get_root_folders()
+        self._movie_index = cache.LibraryIndex(
+            "movies", "tmdbId", library_ttl, self.logger
+        )
+        self._movie_index.refresh(self._fetch_all_movies)
+        self._client = http_helper.build_async_client(
+            pool_size, timeout, keep_alive, max_retries
+        )
+
+    async def aclose(self):
+        await self._client.aclose()
+        self._session.close()
 
     def discover_version(self, api_url, api_key):
         try:
@@ -51,10 +90,19 @@ class Radarr(object):
         self.logger.debug("Failed to discover Radarr version")
         return None
 
-    def lookup_movie(self, title=None, tmdb_id=None):
-        r = self._api_get(
-            "movie/lookup", {"term": f"tmdb:{tmdb_id}" if tmdb_id else quote(title)}
-        )
+    async def lookup_movie(self, title=None, tmdb_id=None):
+        term = f"tmdb:{tmdb_id}" if tmdb_id else title
+        r = self._lookup_cache.get(term)
+        if r is None:
+            r = await self._async_api_get(
+                "movie/lookup",
+                {"term": f"tmdb:{tmdb_id}" if tmdb_id else quote(title)},
+            )
+            self._lookup_cache.put(term, r)
+        await self._movie_index.aensure(self._async_fetch_all_movies)
+        return self._format_lookup_results(r)
+
+    def _format_lookup_results(self, r):
         if not r:
             return []
 
@@ -72,14 +120,23 @@ class Radarr(object):
                 "tmdbId": x.get("tmdbId"),
                 "imdbId": x.get("imdbId", None),
                 "runtime": x.get("runtime"),
-                "id": x.get("id"),
+                "id": x.get("id") or self._movie_internal_id(x.get("tmdbId")),
                 "titleSlug": x.get("titleSlug"),
                 "images": x.get("images"),
             }
             for x in r
         ]
 
-    def add_movie(
+    def _movie_internal_id(self, tmdb_id):
+        return self._movie_index.internal_id(tmdb_id)
+
+    def _fetch_all_movies(self):
+        return self._api_get("movie", {}) or []
+
+    async def _async_fetch_all_movies(self):
+        return await self._async_api_get("movie", {}) or []
+
+    async def add_movie(
         self,
         movie_info=None,
         tmdb_id=None,
@@ -92,12 +149,23 @@ class Radarr(object):
             return False
 
         if not movie_info:
-            movie_info = self.lookup_movie(tmdb_id=tmdb_id)
+            movie_info = await self.lookup_movie(tmdb_id=tmdb_id)
             if len(movie_info):
                 movie_info = movie_info[0]
             else:
                 return False
 
+        params = self._add_movie_params(
+            movie_info, search, monitored, min_avail, additional_data
+        )
+        r = await self._async_api_post("movie", params)
+        self._movie_index.add(r)
+        self._lookup_cache.clear()
+        return r
+
+    def _add_movie_params(
+        self, movie_info, search, monitored, min_avail, additional_data
+    ):
         self.logger.debug(f"Additional data: {additional_data}")
 
         path = additional_data["p"]
@@ -122,7 +190,7 @@ class Radarr(object):
             "addOptions": {"searchForMovie": search},
         }
 
-        return self._api_post("movie", params)
+        return params
 
     def get_root_folders(self):
         r = self._api_get("RootFolder", {})
@@ -140,24 +208,50 @@ class Radarr(object):
         ]
 
     def _api_get(self, endpoint, params={}):
+        # Blocking GET, only used while the constructor loads the basics.
+        # Concurrent callers asking for the same URL share one request
+        url = self._build_url(endpoint, params)
+        return self._inflight.do(url, self._submit_get, url)
+
+    def _submit_get(self, url):
+        self.logger.debug(f"Submitting GET request: [{url}]")
+        r = self._session.get(url, timeout=self._timeout)
+        return http_helper.parse_response(r)
+
+    def _build_url(self, endpoint, params={}):
         url = self.api_url.format(endpoint=endpoint)
         for k, v in params.items():
             url += f"&{k}={v}"
-        self.logger.debug(f"Submitting GET request: [{url}]")
-        r = requests.get(url)
-        if r.status_code not in [200, 201, 202, 204]:
-            r.raise_for_status()
-            return None
-        else:
-            return r.json()
+        return url
+
+    async def _async_api_get(self, endpoint, params={}):
+        url = self._build_url(endpoint, params)
+        return await self._inflight.ado(url, self._async_submit_get, url)
 
-    def get_all_tags(self):
-        r = self._api_get("tag", {})
+    async def _async_submit_get(self, url):
+        self.logger.debug(f"Submitting async GET request: [{url}]")
+        r = await self._client.get(url)
+        return http_helper.parse_response(r)
+
+    async def _async_api_post(self, endpoint, params={}):
+        url = self.api_url.format(endpoint=endpoint)
+        self.logger.debug(
+            f"Submitting async POST request: [{url}]; params: [{params}]"
+        )
+        r = await self._client.post(url, json=params)
+        return http_helper.parse_response(r)
+
+    async def get_all_tags(self):
+        r = await self._async_api_get("tag", {})
         self.logger.debug(f"Result of API call to get all tags: {r}")
         return [] if not r else r
 
-    def get_filtered_tags(self, allowed_tags, excluded_tags):
-        r = self.get_all_tags()
+    async def get_filtered_tags(self, allowed_tags, excluded_tags):
+        return self._filter_tags(
+            await self.get_all_tags(), allowed_tags, excluded_tags
+        )
+
+    def _filter_tags(self, r, allowed_tags, excluded_tags):
         if not r:
             return []
         elif allowed_tags == []:
@@ -176,42 +270,62 @@ class Radarr(object):
                 and x["label"] not in excluded_tags
             ]
 
-    def add_tag(self, tag):
+    async def add_tag(self, tag):
         params = {
             "label": tag,
         }
-        t = self._api_post("tag", params)
+        t = await self._async_api_post("tag", params)
         self.logger.debug(f"Result of API call to add tag: {t}")
         return t
 
-    def get_tag_id(self, tag):
-        if i := next(
+    async def get_tag_id(self, tag):
+        if i := self._find_tag_id(await self.get_all_tags(), tag):
+            self.logger.debug(f"Found tag id [{i}] for tag [{tag}]")
+            return i
+        else:
+            self.logger.debug(f"No tag id found for [{tag}]; adding...")
+            return self._added_tag_id(tag, await self.add_tag(tag))
+
+    async def get_tag_ids(self, tags):
+        # Resolve several tags (adding any that are missing) with one tag fetch
+        all_tags = list(await self.get_all_tags())
+        tag_ids = {}
+        for tag in tags:
+            if i := self._find_tag_id(all_tags, tag):
+                self.logger.debug(f"Found tag id [{i}] for tag [{tag}]")
+            else:
+                self.logger.debug(f"No tag id found for [{tag}]; adding...")
+                t = await self.add_tag(tag)
+                if i := self._added_tag_id(tag, t):
+                    all_tags.append(t)
+            tag_ids[tag] = i
+        return tag_ids
+
+    def _find_tag_id(self, all_tags, tag):
+        return next(
             iter(
                 [
                     x.get("id")
-                    for x in self.get_all_tags()
+                    for x in all_tags
                     if x.get("label").lower() == tag.lower()
                 ]
             ),
             None,
-        ):
-            self.logger.debug(f"Found tag id [{i}] for tag [{tag}]")
-            return i
+        )
+
+    def _added_tag_id(self, tag, t):
+        if not isinstance(t, dict):
+            self.logger.error(
+                f"Wrong data type returned from Radarr API when attempting to add tag [{tag}]. Expected dict, got {type(t)}."
+            )
+            return None
         else:
-            self.logger.debug(f"No tag id found for [{tag}]; adding...")
-            t = self.add_tag(tag)
-            if not isinstance(t, dict):
-                self.logger.error(
-                    f"Wrong data type returned from Radarr API when attempting to add tag [{tag}]. Expected dict, got {type(t)}."
-                )
-                return None
-            else:
-                self.logger.debug(
-                    f"Created tag id for tag [{tag}]: {t['id']}"
-                    if t.get("id")
-                    else f"Could not add tag [{tag}]"
-                )
-            return t.get("id", None)
+            self.logger.debug(
+                f"Created tag id for tag [{tag}]: {t['id']}"
+                if t.get("id")
+                else f"Could not add tag [{tag}]"
+            )
+        return t.get("id", None)
 
     def lookup_quality_profile(self, v):
         # Look up quality profile from a profile name or id
@@ -234,68 +348,75 @@ class Radarr(object):
             None,
         )
 
-    def _api_post(self, endpoint, params={}):
-        url = self.api_url.format(endpoint=endpoint)
-        self.logger.debug(f"Submitting POST request: [{url}]; params: [{params}]")
-        r = requests.post(url, json=params)
-        if r.status_code not in [200, 201, 202, 204]:
-            r.raise_for_status()
-            return None
-        else:
-            return r.json()
-            
-    def search_movie(self, movie_id):
+    async def search_movie(self, movie_id):
         """Trigger a search for an existing movie by its ID."""
-        params = {
-            "name": "MovieSearch",
-            "movieIds": [movie_id]
-        }
+        params = {"name": "MovieSearch", "movieIds": [movie_id]}
         self.logger.debug(f"Triggering search for movie ID: {movie_id}")
-        return self._api_post("command", params)
+        return await self._async_api_post("command", params)
 
-    def add_movie_by_title(self, title: str, year: int, root_folder: str, quality_profile_id=None) -> bool:
+    async def add_movie_by_title(self, title: str, year: int, root_folder: str, quality_profile_id=None) -> bool:
         """Look up a movie on TMDB via Radarr and add it to the library."""
-        results = self.lookup_movie(title)
+        match = self._pick_title_match(title, year, await self.lookup_movie(title))
+        if not match:
+            return False
+        if self._title_already_added(title, match):
+            return True
+
+        additional_data = self._title_add_data(root_folder, quality_profile_id)
+        try:
+            result = await self.add_movie(movie_info=match, search=False, monitored=True, additional_data=additional_data)
+            if result:
+                self.logger.info(f"Added '{title} ({year})' to Radarr (id={result.get('id')})")
+                return True
+        except Exception as e:
+            return self._title_add_failed(title, e)
+        return False
+
+    def _pick_title_match(self, title, year, results):
         if not results:
             self.logger.warning(f"No TMDB results found for '{title}'")
-            return False
+            return None
 
         # Find best match by title + year
         match = next((r for r in results if r.get("year") == year), results[0])
         if not match.get("tmdbId"):
             self.logger.warning(f"No TMDB ID for '{title}'")
-            return False
+            return None
+        return match
 
+    def _title_already_added(self, title, match):
+        # Skip the POST when the library index already has this movie
+        if self._movie_internal_id(match["tmdbId"]):
+            self.logger.info(f"'{title}' already exists in Radarr")
+            return True
+        return False
+
+    def _title_add_data(self, root_folder, quality_profile_id):
         # Use provided quality profile or fall back to first configured one
         if quality_profile_id is None:
             quality_profile_id = self._quality_profiles[0]["id"] if self._quality_profiles else 1
+        return {"p": root_folder, "q": quality_profile_id}
 
-        additional_data = {"p": root_folder, "q": quality_profile_id}
-        try:
-            result = self.add_movie(movie_info=match, search=False, monitored=True, additional_data=additional_data)
-            if result:
-                self.logger.info(f"Added '{title} ({year})' to Radarr (id={result.get('id')})")
-                return True
-        except Exception as e:
-            # Movie may already exist in Radarr — that's fine
-            if "already been added" in str(e).lower() or "409" in str(e):
-                self.logger.info(f"'{title}' already exists in Radarr")
-                return True
-            self.logger.error(f"Failed to add '{title}' to Radarr: {e}")
+    def _title_add_failed(self, title, e):
+        # Movie may already exist in Radarr — that's fine
+        if "already been added" in str(e).lower() or "409" in str(e):
+            self.logger.info(f"'{title}' already exists in Radarr")
+            return True
+        self.logger.error(f"Failed to add '{title}' to Radarr: {e}")
         return False
 
-    def scan_folder(self, path: str):
+    async def scan_folder(self, path: str):
         """Tell Radarr to scan a folder for new movie files."""
         params = {"name": "DownloadedMoviesScan", "path": path}
         self.logger.debug(f"Triggering Radarr folder scan: {path}")
-        return self._api_post("command", params)
+        return await self._async_api_post("command", params)
 
-    def get_missing_movies(self, page_size: int = 250) -> list:
+    async def get_missing_movies(self, page_size: int = 250) -> list:
         """Return all monitored movies that have no file (wanted/missing)."""
         all_records = []
         page = 1
         while True:
-            r = self._api_get("wanted/missing", {"page": page, "pageSize": page_size, "sortKey": "title", "sortDirection": "ascending"})
+            r = await self._async_api_get("wanted/missing", {"page": page, "pageSize": page_size, "sortKey": "title", "sortDirection": "ascending"})
             if not r:
                 break
             records = r.get("records", [])
@@ -303,6 +424,9 @@ class Radarr(object):
             if len(all_records) >= r.get("totalRecords", 0):
                 break
             page += 1
+        return self._format_missing_movies(all_records)
+
+    def _format_missing_movies(self, all_records):
         return [
             {
                 "id": m.get("id"),
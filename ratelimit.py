@@ -0,0 +1,273 @@
+"""
+Searcharr
+Sonarr, Radarr & Readarr Telegram Bot
+Rate Limiter
+https://github.com/toddrob99/searcharr
+"""
+import asyncio
+import time
+from datetime import datetime
+from itertools import count
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+# Priority classes for outgoing Telegram requests; lower goes first
+INTERACTIVE = 0
+NOTIFICATION = 1
+
+# Edits of the same message that replace each other if both are waiting
+COALESCED_ENDPOINTS = {
+    "editMessageText",
+    "editMessageCaption",
+    "editMessageMedia",
+    "editMessageReplyMarkup",
+}
+
+
+class TokenBucketLimiter(object):
+    """In-memory token bucket per user.
+
+    Each user can spend up to capacity tokens, which refill continuously so a
+    full bucket is restored after window seconds. Commands cost one token
+    unless costs says otherwise. Checks are O(1) and never touch the database;
+    snapshot() and restore() let the caller persist buckets across restarts.
+    """
+
+    def __init__(self, capacity, window, costs=None):
+        if capacity <= 0 or window <= 0:
+            raise ValueError(
+                f"Rate limit capacity and window must be positive, not {capacity} and {window}"
+            )
+        self.capacity = capacity
+        self.window = window
+        self.costs = costs or {}
+        self._rate = capacity / window
+        self._buckets = {}
+        self._dirty = set()
+
+    def _refill(self, user_id, now):
+        tokens, updated = self._buckets.get(user_id, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated) * self._rate)
+
+    def allow(self, user_id, command=None):
+        now = time.monotonic()
+        tokens = self._refill(user_id, now)
+        cost = self.costs.get(command, 1)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+            self._dirty.add(user_id)
+        self._buckets[user_id] = (tokens, now)
+        return allowed
+
+    def wait(self, user_id, command=None):
+        # Seconds until allow() would succeed, without spending anything
+        tokens = self._refill(user_id, time.monotonic())
+        cost = self.costs.get(command, 1)
+        return 0 if tokens >= cost else (cost - tokens) / self._rate
+
+    def prune(self):
+        # Full buckets are the default, so there's no need to keep them around
+        now = time.monotonic()
+        self._buckets = {
+            k: v for k, v in self._buckets.items() if self._refill(k, now) < self.capacity
+        }
+
+    def snapshot(self):
+        # Return (user_id, tokens_used, timestamp) for buckets changed since the last snapshot
+        now = time.monotonic()
+        wall = datetime.now().isoformat()
+        rows = [
+            (user_id, self.capacity - self._refill(user_id, now), wall)
+            for user_id in self._dirty
+        ]
+        self._dirty.clear()
+        self.prune()
+        return rows
+
+    def restore(self, rows):
+        # Rebuild buckets from snapshot() rows, refilling for the time since they were saved
+        now = time.monotonic()
+        for user_id, used, saved_at in rows:
+            try:
+                elapsed = (datetime.now() - datetime.fromisoformat(saved_at)).total_seconds()
+            except (TypeError, ValueError):
+                continue
+            tokens = min(self.capacity, self.capacity - used + max(0, elapsed) * self._rate)
+            if tokens < self.capacity:
+                self._buckets[user_id] = (tokens, now)
+
+
+class _Request(object):
+    def __init__(self, priority, seq, chat_id, key):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.key = key
+        self.turn = None  # Resolved with None to send, or with a replacing _Request
+        self.result = asyncio.get_running_loop().create_future()
+
+
+class OutboundRateLimiter(BaseRateLimiter):
+    """Pace outgoing Telegram requests to stay within the Bot API limits.
+
+    Requests for a chat wait for a token from that chat's bucket (a slower
+    one for groups) and from the global bucket. Waiting requests are let go
+    in priority order, so interactive replies overtake queued notifications,
+    and a chat that has used up its allowance doesn't hold up other chats.
+    A waiting edit of a message is replaced by a newer edit of the same kind,
+    and its caller gets the newer edit's result. On RetryAfter the chat is
+    paused for as long as Telegram asks and the request is queued again.
+    Requests not aimed at a chat (getUpdates, answerCallbackQuery, ...)
+    are not paced.
+
+    Pass rate_limit_args={"priority": NOTIFICATION} to send at low priority.
+    """
+
+    def __init__(
+        self,
+        logger,
+        overall_rate=30,
+        chat_rate=1,
+        chat_burst=3,
+        group_rate=20 / 60,
+        max_retries=2,
+    ):
+        self.logger = logger
+        self.max_retries = max_retries
+        self._overall = TokenBucketLimiter(overall_rate, 1)
+        self._chats = TokenBucketLimiter(chat_burst, chat_burst / chat_rate)
+        self._groups = TokenBucketLimiter(chat_burst, chat_burst / group_rate)
+        self._paused = {}  # chat_id -> time.monotonic() when it may send again
+        self._waiting = []
+        self._seq = count()
+        self._wakeup = None
+        self._task = None
+
+    async def initialize(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._dispatch(), name="telegram-send-queue")
+
+    async def shutdown(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for request in self._waiting:
+            request.turn.cancel()
+        self._waiting = []
+
+    def _bucket(self, chat_id):
+        # Group and channel ids are negative (or @usernames)
+        if isinstance(chat_id, str) or chat_id < 0:
+            return self._groups
+        return self._chats
+
+    def _enqueue(self, request):
+        request.turn = asyncio.get_running_loop().create_future()
+        for i, waiting in enumerate(self._waiting):
+            if request.key and waiting.key == request.key and not waiting.turn.done():
+                # Take the older edit's place in the queue and answer for it
+                request.priority, request.seq = waiting.priority, waiting.seq
+                self._waiting[i] = request
+                waiting.turn.set_result(request)
+                break
+        else:
+            self._waiting.append(request)
+        self._waiting.sort(key=lambda x: (x.priority, x.seq))
+        self._wakeup.set()
+
+    def _release(self):
+        # Let waiting requests go while tokens last and return the seconds until
+        # the next one could go (None if nothing is waiting)
+        now = time.monotonic()
+        next_wait = None
+        for request in list(self._waiting):
+            if request.turn.done():
+                # The caller gave up waiting
+                self._waiting.remove(request)
+                continue
+            overall = self._overall.wait(None)
+            if overall > 0:
+                # Nothing else can go either
+                return overall if next_wait is None else min(next_wait, overall)
+            bucket = self._bucket(request.chat_id)
+            wait = max(
+                bucket.wait(request.chat_id),
+                self._paused.get(request.chat_id, 0) - now,
+            )
+            if wait > 0:
+                next_wait = wait if next_wait is None else min(next_wait, wait)
+                continue
+            self._overall.allow(None)
+            bucket.allow(request.chat_id)
+            self._paused.pop(request.chat_id, None)
+            self._waiting.remove(request)
+            request.turn.set_result(None)
+        return next_wait
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            wait = self._release()
+            if not self._waiting:
+                self._chats.prune()
+                self._groups.prune()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def process_request(
+        self, callback, args, kwargs, endpoint, data, rate_limit_args
+    ):
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            return await self._send(callback, args, kwargs, endpoint, None)
+
+        priority = (rate_limit_args or {}).get("priority", INTERACTIVE)
+        key = None
+        if endpoint in COALESCED_ENDPOINTS and data.get("message_id"):
+            key = (endpoint, chat_id, data["message_id"])
+        request = _Request(priority, next(self._seq), chat_id, key)
+        try:
+            result = await self._send(callback, args, kwargs, endpoint, request)
+        except asyncio.CancelledError:
+            request.result.cancel()
+            raise
+        except Exception as e:
+            request.result.set_exception(e)
+            request.result.exception()  # Nobody may be waiting on it
+            raise
+        # Answer for any older edits this request replaced
+        request.result.set_result(result)
+        return result
+
+    async def _send(self, callback, args, kwargs, endpoint, request):
+        for attempt in range(self.max_retries + 1):
+            if request:
+                self._enqueue(request)
+                if replacement := await request.turn:
+                    self.logger.debug(
+                        f"Dropped {endpoint} for chat [{request.chat_id}] in favour of a newer edit"
+                    )
+                    return await asyncio.shield(replacement.result)
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = e.retry_after
+                if hasattr(retry_after, "total_seconds"):
+                    # A timedelta in newer versions of python-telegram-bot
+                    retry_after = retry_after.total_seconds()
+                self.logger.warning(
+                    f"Telegram asked to wait {retry_after}s before {endpoint} to chat [{request.chat_id if request else None}]"
+                )
+                if request:
+                    self._paused[request.chat_id] = time.monotonic() + retry_after
+                else:
+                    await asyncio.sleep(retry_after)
+                continue
+            return result
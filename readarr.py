@@ -9,12 +9,40 @@ import requests
 from urllib.parse import quote
 
 from log import set_up_logger
+import cache
+import http_helper
 
 
 class Readarr(object):
-    def __init__(self, api_url, api_key, verbose=False):
+    """Readarr API wrapper whose per-request methods are coroutines.
+
+    Version discovery, quality profiles, root folders and the first library
+    fetch are loaded synchronously by the constructor (before the bot starts
+    handling updates); everything a handler calls afterwards goes through an
+    httpx.AsyncClient so the event loop is never blocked on Readarr.
+    """
+
+    def __init__(
+        self,
+        api_url,
+        api_key,
+        verbose=False,
+        pool_size=http_helper.DEFAULT_POOL_SIZE,
+        timeout=http_helper.DEFAULT_TIMEOUT,
+        keep_alive=True,
+        max_retries=http_helper.DEFAULT_MAX_RETRIES,
+        library_ttl=300,
+        lookup_cache_size=256,
+        lookup_cache_ttl=600,
+    ):
         self.logger = set_up_logger("searcharr.readarr", verbose, False)
         self.logger.debug("Logging started!")
+        self._timeout = http_helper.normalize_timeout(timeout)
+        self._session = http_helper.build_session(pool_size, max_retries, keep_alive)
+        self._inflight = http_helper.SingleFlight()
+        self._lookup_cache = cache.LookupCache(
+            "Readarr", lookup_cache_size, lookup_cache_ttl, self.logger
+        )
         if api_url[-1] == "/":
             api_url = api_url[:-1]
         if api_url[:4] != "http":
@@ -27,6 +55,17 @@ class Readarr(object):
         self._quality_profiles = self.get_all_quality_profiles()
         self._metadata_profiles = self.get_all_metadata_profiles()
         self._root_folders = self.get_root_folders()
+        self._book_index = cache.LibraryIndex(
+            "books", "foreignBookId", library_ttl, self.logger
+        )
+        self._book_index.refresh(self._fetch_all_books)
+        self._client = http_helper.build_async_client(
+            pool_size, timeout, keep_alive, max_retries
+        )
+
+    async def aclose(self):
+        await self._client.aclose()
+        self._session.close()
 
     def discover_version(self, api_url, api_key):
         try:
@@ -52,8 +91,15 @@ class Readarr(object):
         self.logger.debug("Failed to discover Readarr version")
         return None
 
-    def lookup_book(self, title):
-        r = self._api_get("search", {"term": quote(title)})
+    async def lookup_book(self, title):
+        r = self._lookup_cache.get(title)
+        if r is None:
+            r = await self._async_api_get("search", {"term": quote(title)})
+            self._lookup_cache.put(title, r)
+        await self._book_index.aensure(self._async_fetch_all_books)
+        return self._format_lookup_results(r)
+
+    def _format_lookup_results(self, r):
         if not r:
             return []
 
@@ -71,7 +117,8 @@ class Readarr(object):
                 ),
                 "releaseDate": x.get("book").get("releaseDate"),
                 "foreignBookId": x.get("book").get("foreignBookId"),
-                "id": x.get("book").get("id"),
+                "id": x.get("book").get("id")
+                or self._book_internal_id(x.get("book").get("foreignBookId")),
                 "pageCount": x.get("book").get("pageCount"),
                 "titleSlug": x.get("book").get("titleSlug"),
                 "images": x.get("book").get("images"),
@@ -83,7 +130,16 @@ class Readarr(object):
             if x.get("book")
         ]
 
-    def add_book(
+    def _book_internal_id(self, foreign_book_id):
+        return self._book_index.internal_id(foreign_book_id)
+
+    def _fetch_all_books(self):
+        return self._api_get("book", {}) or []
+
+    async def _async_fetch_all_books(self):
+        return await self._async_api_get("book", {}) or []
+
+    async def add_book(
         self,
         book_info=None,
         search=True,
@@ -93,13 +149,20 @@ class Readarr(object):
         if not book_info:
             return False
 
-        if not book_info:
-            book_info = self.lookup_book(book_info["title"])
-            if len(book_info):
-                book_info = book_info[0]
-            else:
-                return False
+        rsp = await self._async_api_post(
+            "book", self._add_book_params(book_info, monitored, additional_data)
+        )
+        if rsp is not None and search:
+            # Force book search
+            srsp = await self._async_api_post(
+                "command", {"name": "BookSearch", "bookIds": [rsp.get("id")]}
+            )
+            self.logger.debug(f"Result of attempt to search book: {srsp}")
+        self._book_index.add(rsp)
+        self._lookup_cache.clear()
+        return rsp
 
+    def _add_book_params(self, book_info, monitored, additional_data):
         self.logger.debug(f"Additional data: {additional_data}")
 
         path = additional_data["p"]
@@ -131,14 +194,7 @@ class Readarr(object):
             },
         }
 
-        rsp = self._api_post("book", params)
-        if rsp is not None and search:
-            # Force book search
-            srsp = self._api_post(
-                "command", {"name": "BookSearch", "bookIds": [rsp.get("id")]}
-            )
-            self.logger.debug(f"Result of attempt to search book: {srsp}")
-        return rsp
+        return params
 
     def get_root_folders(self):
         r = self._api_get("rootfolder", {})
@@ -156,24 +212,50 @@ class Readarr(object):
         ]
 
     def _api_get(self, endpoint, params={}):
+        # Blocking GET, only used while the constructor loads the basics.
+        # Concurrent callers asking for the same URL share one request
+        url = self._build_url(endpoint, params)
+        return self._inflight.do(url, self._submit_get, url)
+
+    def _submit_get(self, url):
+        self.logger.debug(f"Submitting GET request: [{url}]")
+        r = self._session.get(url, timeout=self._timeout)
+        return http_helper.parse_response(r)
+
+    def _build_url(self, endpoint, params={}):
         url = self.api_url.format(endpoint=endpoint)
         for k, v in params.items():
             url += f"&{k}={v}"
-        self.logger.debug(f"Submitting GET request: [{url}]")
-        r = requests.get(url)
-        if r.status_code not in [200, 201, 202, 204]:
-            r.raise_for_status()
-            return None
-        else:
-            return r.json()
+        return url
+
+    async def _async_api_get(self, endpoint, params={}):
+        url = self._build_url(endpoint, params)
+        return await self._inflight.ado(url, self._async_submit_get, url)
+
+    async def _async_submit_get(self, url):
+        self.logger.debug(f"Submitting async GET request: [{url}]")
+        r = await self._client.get(url)
+        return http_helper.parse_response(r)
+
+    async def _async_api_post(self, endpoint, params={}):
+        url = self.api_url.format(endpoint=endpoint)
+        self.logger.debug(
+            f"Submitting async POST request: [{url}]; params: [{params}]"
+        )
+        r = await self._client.post(url, json=params)
+        return http_helper.parse_response(r)
 
-    def get_all_tags(self):
-        r = self._api_get("tag", {})
+    async def get_all_tags(self):
+        r = await self._async_api_get("tag", {})
         self.logger.debug(f"Result of API call to get all tags: {r}")
         return [] if not r else r
 
-    def get_filtered_tags(self, allowed_tags, excluded_tags):
-        r = self.get_all_tags()
+    async def get_filtered_tags(self, allowed_tags, excluded_tags):
+        return self._filter_tags(
+            await self.get_all_tags(), allowed_tags, excluded_tags
+        )
+
+    def _filter_tags(self, r, allowed_tags, excluded_tags):
         if not r:
             return []
         elif allowed_tags == []:
@@ -192,42 +274,62 @@ class Readarr(object):
                 and x["label"] not in excluded_tags
             ]
 
-    def add_tag(self, tag):
+    async def add_tag(self, tag):
         params = {
             "label": tag,
         }
-        t = self._api_post("tag", params)
+        t = await self._async_api_post("tag", params)
         self.logger.debug(f"Result of API call to add tag: {t}")
         return t
 
-    def get_tag_id(self, tag):
-        if i := next(
+    async def get_tag_id(self, tag):
+        if i := self._find_tag_id(await self.get_all_tags(), tag):
+            self.logger.debug(f"Found tag id [{i}] for tag [{tag}]")
+            return i
+        else:
+            self.logger.debug(f"No tag id found for [{tag}]; adding...")
+            return self._added_tag_id(tag, await self.add_tag(tag))
+
+    async def get_tag_ids(self, tags):
+        # Resolve several tags (adding any that are missing) with one tag fetch
+        all_tags = list(await self.get_all_tags())
+        tag_ids = {}
+        for tag in tags:
+            if i := self._find_tag_id(all_tags, tag):
+                self.logger.debug(f"Found tag id [{i}] for tag [{tag}]")
+            else:
+                self.logger.debug(f"No tag id found for [{tag}]; adding...")
+                t = await self.add_tag(tag)
+                if i := self._added_tag_id(tag, t):
+                    all_tags.append(t)
+            tag_ids[tag] = i
+        return tag_ids
+
+    def _find_tag_id(self, all_tags, tag):
+        return next(
             iter(
                 [
                     x.get("id")
-                    for x in self.get_all_tags()
+                    for x in all_tags
                     if x.get("label").lower() == tag.lower()
                 ]
             ),
             None,
-        ):
-            self.logger.debug(f"Found tag id [{i}] for tag [{tag}]")
-            return i
+        )
+
+    def _added_tag_id(self, tag, t):
+        if not isinstance(t, dict):
+            self.logger.error(
+                f"Wrong data type returned from Readarr API when attempting to add tag [{tag}]. Expected dict, got {type(t)}."
+            )
+            return None
         else:
-            self.logger.debug(f"No tag id found for [{tag}]; adding...")
-            t = self.add_tag(tag)
-            if not isinstance(t, dict):
-                self.logger.error(
-                    f"Wrong data type returned from Readarr API when attempting to add tag [{tag}]. Expected dict, got {type(t)}."
-                )
-                return None
-            else:
-                self.logger.debug(
-                    f"Created tag id for tag [{tag}]: {t['id']}"
-                    if t.get("id")
-                    else f"Could not add tag [{tag}]"
-                )
-            return t.get("id", None)
+            self.logger.debug(
+                f"Created tag id for tag [{tag}]: {t['id']}"
+                if t.get("id")
+                else f"Could not add tag [{tag}]"
+            )
+        return t.get("id", None)
 
     def lookup_quality_profile(self, v):
         # Look up quality profile from a profile name or id
@@ -255,13 +357,3 @@ class Readarr(object):
             (x for x in self._root_folders if str(v) in [x["path"], str(x["id"])]),
             None,
         )
-
-    def _api_post(self, endpoint, params={}):
-        url = self.api_url.format(endpoint=endpoint)
-        self.logger.debug(f"Submitting POST request: [{url}]; params: [{params}]")
-        r = requests.post(url, json=params)
-        if r.status_code not in [200, 201, 202, 204]:
-            r.raise_for_status()
-            return None
-        else:
-            return r.json()
@@ -5,24 +5,30 @@ By Todd Roberts
 https://github.com/toddrob99/searcharr
 """
 import argparse
-import json
 import os
 import yaml
 import sqlite3
 from pathlib import Path
-from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import parse_qsl
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import asyncio
 import time
 
+from aiohttp import web
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
 from telegram.error import BadRequest
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler
 
 from log import set_up_logger
+import cache
+import conversations
+import db
+import http_helper
+import migrations
+import ratelimit
 import radarr
 import sonarr
 import readarr
@@ -30,13 +36,17 @@ import settings
 import ytdl_helper
 import plex_helper
 import plex_webhook
+import telegram_webhook
+import update_processor
 from transmissionstatus import StatusFinder
 
 __version__ = "3.2.2"
 
 DBPATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data")
 DBFILE = "searcharr.db"
-DBLOCK = Lock()
+REQUEST_HISTORY_PRUNE_BATCH = 5000
+REQUEST_HISTORY_PRUNE_DELAY = 300  # Seconds after startup before the first prune
+DEFAULT_POSTER = "https://artworks.thetvdb.com/banners/images/missing/movie.jpg"
 
 
 def parse_args():
@@ -64,6 +74,12 @@ def parse_args():
         dest="dev_mode",
         help="Enable developer mode, which will result in more exceptions being raised instead of handled.",
     )
+    parser.add_argument(
+        "--migrate-dry-run",
+        action="store_true",
+        dest="migrate_dry_run",
+        help="Try any pending database migrations without saving them, then exit.",
+    )
     return parser.parse_args()
 
 
@@ -76,11 +92,57 @@ class Searcharr(object):
         self._lang = self._load_language()
         if self._lang.get("language_ietf") != "en-us":
             self._lang_default = self._load_language("en-us")
-        self.sonarr = (
-            sonarr.Sonarr(settings.sonarr_url, settings.sonarr_api_key, args.verbose)
-            if settings.sonarr_enabled
-            else None
+        # Connection pool and lookup cache tuning shared by the Sonarr/Radarr/Readarr API wrappers
+        arr_options = {
+            "pool_size": getattr(
+                settings, "searcharr_http_pool_size", http_helper.DEFAULT_POOL_SIZE
+            ),
+            "timeout": getattr(
+                settings, "searcharr_http_timeout", http_helper.DEFAULT_TIMEOUT
+            ),
+            "keep_alive": getattr(settings, "searcharr_http_keep_alive", True),
+            "max_retries": getattr(
+                settings, "searcharr_http_max_retries", http_helper.DEFAULT_MAX_RETRIES
+            ),
+            "lookup_cache_size": getattr(settings, "searcharr_lookup_cache_size", 256),
+            "lookup_cache_ttl": getattr(settings, "searcharr_lookup_cache_ttl", 600),
+        }
+        if not hasattr(settings, "readarr_enabled"):
+            settings.readarr_enabled = False
+            logger.warning(
+                "No readarr_enabled setting found. If you want Searcharr to support Readarr, please refer to the sample settings on github and add settings for Readarr to settings.py."
+            )
+        self._startup_timings = {}
+        self._auth_cache = {}
+        self._auth_cache_loaded = None
+        self._background_tasks = []
+        # Decoded conversations and add data, backed by the database
+        convo_cache_size = getattr(settings, "searcharr_conversation_cache_size", 128)
+        self._convo_cache = cache.LRUCache("conversation", convo_cache_size, logger)
+        self._add_data_cache = cache.LRUCache("add data", convo_cache_size, logger)
+        self._convo_writes = 0
+        # Poster URL -> Telegram file_id, so Telegram only fetches each poster once
+        self._poster_cache = cache.LRUCache(
+            "poster", getattr(settings, "searcharr_poster_cache_size", 2048), logger
         )
+        try:
+            self._rate_limiter = ratelimit.TokenBucketLimiter(
+                getattr(settings, "rate_limit_requests", 20),
+                getattr(settings, "rate_limit_window", 60),
+                getattr(settings, "rate_limit_command_costs", {}),
+            )
+        except ValueError as e:
+            logger.error(f"Invalid rate limit settings ({e}); using 20 requests per 60 seconds")
+            self._rate_limiter = ratelimit.TokenBucketLimiter(
+                20, 60, getattr(settings, "rate_limit_command_costs", {})
+            )
+        discovery_start = time.monotonic()
+        backends = self._connect_backends(arr_options)
+        self._startup_timings["discovery"] = time.monotonic() - discovery_start
+        validation_start = time.monotonic()
+        self.sonarr = backends.get("sonarr")
+        self.radarr = backends.get("radarr")
+        self.readarr = backends.get("readarr")
         if self.sonarr:
             quality_profiles = []
             if not isinstance(settings.sonarr_quality_profile_id, list):
@@ -164,19 +226,6 @@ class Searcharr(object):
                 logger.warning(
                     'No sonarr_user_selectable_tags setting found. Please add sonarr_user_selectable_tags to settings.py (e.g. sonarr_user_selectable_tags=["tag-1", "tag-2"]) if you want to limit the tags a user can select. Defaulting to empty list ([]), which will present the user with all tags.'
                 )
-            for t in settings.sonarr_user_selectable_tags:
-                if t_id := self.sonarr.get_tag_id(t):
-                    logger.debug(
-                        f"Tag id [{t_id}] for user-selectable Sonarr tag [{t}]"
-                    )
-            for t in settings.sonarr_forced_tags:
-                if t_id := self.sonarr.get_tag_id(t):
-                    logger.debug(f"Tag id [{t_id}] for forced Sonarr tag [{t}]")
-        self.radarr = (
-            radarr.Radarr(settings.radarr_url, settings.radarr_api_key, args.verbose)
-            if settings.radarr_enabled
-            else None
-        )
         if self.radarr:
             quality_profiles = []
             if not isinstance(settings.radarr_quality_profile_id, list):
@@ -260,28 +309,6 @@ class Searcharr(object):
                 logger.warning(
                     'No radarr_user_selectable_tags setting found. Please add radarr_user_selectable_tags to settings.py (e.g. radarr_user_selectable_tags=["tag-1", "tag-2"]) if you want to limit the tags a user can select. Defaulting to empty list ([]), which will present the user with all tags.'
                 )
-            for t in settings.radarr_user_selectable_tags:
-                if t_id := self.radarr.get_tag_id(t):
-                    logger.debug(
-                        f"Tag id [{t_id}] for user-selectable Radarr tag [{t}]"
-                    )
-            for t in settings.radarr_forced_tags:
-                if t_id := self.radarr.get_tag_id(t):
-                    logger.debug(f"Tag id [{t_id}] for forced Radarr tag [{t}]")
-        if hasattr(settings, "readarr_enabled"):
-            self.readarr = (
-                readarr.Readarr(
-                    settings.readarr_url, settings.readarr_api_key, args.verbose
-                )
-                if settings.readarr_enabled
-                else None
-            )
-        else:
-            settings.readarr_enabled = False
-            self.readarr = None
-            logger.warning(
-                "No readarr_enabled setting found. If you want Searcharr to support Readarr, please refer to the sample settings on github and add settings for Readarr to settings.py."
-            )
         if self.readarr:
             quality_profiles = []
             if not isinstance(settings.readarr_quality_profile_id, list):
@@ -386,14 +413,6 @@ class Searcharr(object):
                 logger.warning(
                     'No readarr_user_selectable_tags setting found. Please add readarr_user_selectable_tags to settings.py (e.g. readarr_user_selectable_tags=["tag-1", "tag-2"]) if you want to limit the tags a user can select. Defaulting to empty list ([]), which will present the user with all tags.'
                 )
-            for t in settings.readarr_user_selectable_tags:
-                if t_id := self.readarr.get_tag_id(t):
-                    logger.debug(
-                        f"Tag id [{t_id}] for user-selectable Readarr tag [{t}]"
-                    )
-            for t in settings.readarr_forced_tags:
-                if t_id := self.readarr.get_tag_id(t):
-                    logger.debug(f"Tag id [{t_id}] for forced Readarr tag [{t}]")
 
         self.conversations = {}
         if not hasattr(settings, "searcharr_admin_password"):
@@ -420,12 +439,62 @@ class Searcharr(object):
             logger.warning(
                 'No searcharr_users_command_aliases setting found. Please add searcharr_users_command_aliases to settings.py (e.g. searcharr_users_command_aliases=["users"]. Defaulting to ["users"].'
             )
+        self._startup_timings["validation"] = time.monotonic() - validation_start
+
+    def _connect_backends(self, arr_options):
+        # Discover Sonarr, Radarr and Readarr concurrently. A backend that cannot
+        # be reached is disabled for this session instead of stopping the bot.
+        wanted = [
+            (name, cls)
+            for name, cls in [
+                ("sonarr", sonarr.Sonarr),
+                ("radarr", radarr.Radarr),
+                ("readarr", readarr.Readarr),
+            ]
+            if getattr(settings, f"{name}_enabled")
+        ]
+        if not wanted:
+            return {}
+        with ThreadPoolExecutor(
+            max_workers=len(wanted), thread_name_prefix="searcharr-startup"
+        ) as pool:
+            futures = {
+                name: pool.submit(self._connect_backend, name, cls, arr_options)
+                for name, cls in wanted
+            }
+        backends = {}
+        for name, future in futures.items():
+            backends[name] = future.result()
+            if not backends[name]:
+                setattr(settings, f"{name}_enabled", False)
+        return backends
+
+    def _connect_backend(self, name, cls, arr_options):
+        start = time.monotonic()
+        url = getattr(settings, f"{name}_url")
+        options = dict(arr_options)
+        options["library_ttl"] = getattr(settings, f"{name}_library_cache_ttl", 300)
+        try:
+            return cls(url, getattr(settings, f"{name}_api_key"), args.verbose, **options)
+        except Exception as e:
+            logger.error(
+                f"Unable to connect to {name.title()} at [{url}]: {e}. {name.title()} support is disabled until Searcharr is restarted."
+            )
+            return None
+        finally:
+            self._startup_timings[f"{name}_discovery"] = time.monotonic() - start
+
+    def _log_startup_timings(self):
+        logger.info(
+            "Startup timings: "
+            + ", ".join(f"{k}={v:.2f}s" for k, v in self._startup_timings.items())
+        )
 
     async def cmd_start(self, update, context):
         logger.debug(f"Received start cmd from [{update.message.from_user.username}]")
         password = self._strip_entities(update.message)
         if password and password == settings.searcharr_admin_password:
-            self._add_user(
+            await self._add_user(
                 id=update.message.from_user.id,
                 username=str(update.message.from_user.username),
                 admin=1,
@@ -438,7 +507,7 @@ class Searcharr(object):
                     ),
                 )
             )
-        elif self._authenticated(update.message.from_user.id):
+        elif await self._authenticated(update.message.from_user.id):
             await update.message.reply_text(
                 self._xlate(
                     "already_authenticated",
@@ -448,7 +517,7 @@ class Searcharr(object):
                 )
             )
         elif password == settings.searcharr_password:
-            self._add_user(
+            await self._add_user(
                 id=update.message.from_user.id,
                 username=str(update.message.from_user.username),
             )
@@ -465,7 +534,7 @@ class Searcharr(object):
 
     async def cmd_book(self, update, context):
         logger.debug(f"Received book cmd from [{update.message.from_user.username}]")
-        if not self._authenticated(update.message.from_user.id):
+        if not await self._authenticated(update.message.from_user.id):
             await update.message.reply_text(
                 self._xlate(
                     "auth_required",
@@ -496,10 +565,13 @@ class Searcharr(object):
                 )
             )
             return
-        results = self.readarr.lookup_book(title)
+        if not self._check_rate_limit(update.message.from_user.id, "book"):
+            await update.message.reply_text(self._xlate("rate_limit_exceeded"))
+            return
+        results = await self.readarr.lookup_book(title)
         cid = self._generate_cid()
         # self.conversations.update({cid: {"cid": cid, "type": "book", "results": results}})
-        self._create_conversation(
+        await self._create_conversation(
             id=cid,
             username=str(update.message.from_user.username),
             kind="book",
@@ -513,30 +585,19 @@ class Searcharr(object):
             reply_message, reply_markup = self._prepare_response(
                 "book", r, cid, 0, len(results)
             )
-            try:
-                await context.bot.send_photo(
+            await self._send_with_poster(
+                r["remotePoster"],
+                lambda photo: context.bot.send_photo(
                     chat_id=update.message.chat.id,
-                    photo=r["remotePoster"],
+                    photo=photo,
                     caption=reply_message,
                     reply_markup=reply_markup,
-                )
-            except BadRequest as e:
-                if str(e) in self._bad_request_poster_error_messages:
-                    logger.error(
-                        f"Error sending photo [{r['remotePoster']}]: BadRequest: {e}. Attempting to send with default poster..."
-                    )
-                    await context.bot.send_photo(
-                        chat_id=update.message.chat.id,
-                        photo="https://artworks.thetvdb.com/banners/images/missing/movie.jpg",
-                        caption=reply_message,
-                        reply_markup=reply_markup,
-                    )
-                else:
-                    raise
+                ),
+            )
 
     async def cmd_movie(self, update, context):
         logger.debug(f"Received movie cmd from [{update.message.from_user.username}]")
-        if not self._authenticated(update.message.from_user.id):
+        if not await self._authenticated(update.message.from_user.id):
             await update.message.reply_text(
                 self._xlate(
                     "auth_required",
@@ -567,10 +628,13 @@ class Searcharr(object):
                 )
             )
             return
-        results = self.radarr.lookup_movie(title)
+        if not self._check_rate_limit(update.message.from_user.id, "movie"):
+            await update.message.reply_text(self._xlate("rate_limit_exceeded"))
+            return
+        results = await self.radarr.lookup_movie(title)
         cid = self._generate_cid()
         # self.conversations.update({cid: {"cid": cid, "type": "movie", "results": results}})
-        self._create_conversation(
+        await self._create_conversation(
             id=cid,
             username=str(update.message.from_user.username),
             kind="movie",
@@ -584,30 +648,19 @@ class Searcharr(object):
             reply_message, reply_markup = self._prepare_response(
                 "movie", r, cid, 0, len(results)
             )
-            try:
-                await context.bot.send_photo(
+            await self._send_with_poster(
+                r["remotePoster"],
+                lambda photo: context.bot.send_photo(
                     chat_id=update.message.chat.id,
-                    photo=r["remotePoster"],
+                    photo=photo,
                     caption=reply_message,
                     reply_markup=reply_markup,
-                )
-            except BadRequest as e:
-                if str(e) in self._bad_request_poster_error_messages:
-                    logger.error(
-                        f"Error sending photo [{r['remotePoster']}]: BadRequest: {e}. Attempting to send with default poster..."
-                    )
-                    await context.bot.send_photo(
-                        chat_id=update.message.chat.id,
-                        photo="https://artworks.thetvdb.com/banners/images/missing/movie.jpg",
-                        caption=reply_message,
-                        reply_markup=reply_markup,
-                    )
-                else:
-                    raise
+                ),
+            )
 
     async def cmd_series(self, update, context):
         logger.debug(f"Received series cmd from [{update.message.from_user.username}]")
-        if not self._authenticated(update.message.from_user.id):
+        if not await self._authenticated(update.message.from_user.id):
             await update.message.reply_text(
                 self._xlate(
                     "auth_required",
@@ -638,10 +691,13 @@ class Searcharr(object):
                 )
             )
             return
-        results = self.sonarr.lookup_series(title)
+        if not self._check_rate_limit(update.message.from_user.id, "series"):
+            await update.message.reply_text(self._xlate("rate_limit_exceeded"))
+            return
+        results = await self.sonarr.lookup_series(title)
         cid = self._generate_cid()
         # self.conversations.update({cid: {"cid": cid, "type": "series", "results": results}})
-        self._create_conversation(
+        await self._create_conversation(
             id=cid,
             username=str(update.message.from_user.username),
             kind="series",
@@ -655,30 +711,19 @@ class Searcharr(object):
             reply_message, reply_markup = self._prepare_response(
                 "series", r, cid, 0, len(results)
             )
-            try:
-                await context.bot.send_photo(
+            await self._send_with_poster(
+                r["remotePoster"],
+                lambda photo: context.bot.send_photo(
                     chat_id=update.message.chat.id,
-                    photo=r["remotePoster"],
+                    photo=photo,
                     caption=reply_message,
                     reply_markup=reply_markup,
-                )
-            except BadRequest as e:
-                if str(e) in self._bad_request_poster_error_messages:
-                    logger.error(
-                        f"Error sending photo [{r['remotePoster']}]: BadRequest: {e}. Attempting to send with default poster..."
-                    )
-                    await context.bot.send_photo(
-                        chat_id=update.message.chat.id,
-                        photo="https://artworks.thetvdb.com/banners/images/missing/movie.jpg",
-                        caption=reply_message,
-                        reply_markup=reply_markup,
-                    )
-                else:
-                    raise
+                ),
+            )
 
     async def cmd_users(self, update, context):
         logger.debug(f"Received users cmd from [{update.message.from_user.username}]")
-        auth_level = self._authenticated(update.message.from_user.id)
+        auth_level = await self._authenticated(update.message.from_user.id)
         if not auth_level:
             await update.message.reply_text(
                 self._xlate(
@@ -706,10 +751,10 @@ class Searcharr(object):
             )
             return
 
-        results = self._get_users()
+        results = await self._get_users()
         cid = self._generate_cid()
         # self.conversations.update({cid: {"cid": cid, "type": "users", "results": results}})
-        self._create_conversation(
+        await self._create_conversation(
             id=cid,
             username=str(update.message.from_user.username),
             kind="users",
@@ -736,7 +781,7 @@ class Searcharr(object):
         logger.debug(
             f"Received callback from [{query.from_user.username}]: [{query.data}]"
         )
-        auth_level = self._authenticated(query.from_user.id)
+        auth_level = await self._authenticated(query.from_user.id)
         if not auth_level:
             await query.message.reply_text(
                 self._xlate(
@@ -763,7 +808,7 @@ class Searcharr(object):
             await self._handle_ytfillstop_callback(query, context)
             return
 
-        convo = self._get_conversation(query.data.split("^^^")[0])
+        convo = await self._get_conversation(query.data.split("^^^")[0])
         # convo = self.conversations.get(query.data.split("^^^")[0])
         if not convo:
             await query.message.reply_text(self._xlate("convo_not_found"))
@@ -772,6 +817,9 @@ class Searcharr(object):
             return
 
         cid, i, op = query.data.split("^^^")
+        # Add data is read once here, changed in memory while handling the
+        # button and written back in a single transaction afterwards
+        add_data = await self._get_add_data(cid)
         op_flags = {}
         if "^^" in op:
             op, op_flags = op.split("^^")
@@ -780,17 +828,27 @@ class Searcharr(object):
                 logger.debug(
                     f"Adding/Updating additional data for cid=[{cid}], key=[{k}], value=[{v}]..."
                 )
-                self._update_add_data(cid, k, v)
+                add_data[k] = v
+        try:
+            await self._handle_callback_op(
+                query, context, auth_level, convo, cid, i, op, op_flags, add_data
+            )
+        finally:
+            await self._save_add_data(cid, add_data)
+
+    async def _handle_callback_op(
+        self, query, context, auth_level, convo, cid, i, op, op_flags, add_data
+    ):
         i = int(i)
         if op == "noop":
             pass
         elif op == "cancel":
-            self._delete_conversation(cid)
+            await self._delete_conversation(cid)
             # self.conversations.pop(cid)
             await query.message.reply_text(self._xlate("search_canceled"))
             await query.message.delete()
         elif op == "done":
-            self._delete_conversation(cid)
+            await self._delete_conversation(cid)
             # self.conversations.pop(cid)
             await query.message.delete()
         elif op == "prev":
@@ -799,32 +857,13 @@ class Searcharr(object):
                     await query.answer()
                     return
                 r = convo["results"][i - 1]
-                reply_message, reply_markup = self._prepare_response(
-                    convo["type"], r, cid, i - 1, len(convo["results"])
-                )
-                try:
-                    await query.message.edit_media(
-                        media=InputMediaPhoto(r["remotePoster"]),
-                        reply_markup=reply_markup,
-                    )
-                except BadRequest as e:
-                    if str(e) in self._bad_request_poster_error_messages:
-                        logger.error(
-                            f"Error sending photo [{r['remotePoster']}]: BadRequest: {e}. Attempting to send with default poster..."
-                        )
-                        await query.message.edit_media(
-                            media=InputMediaPhoto(
-                                "https://artworks.thetvdb.com/banners/images/missing/movie.jpg"
-                            ),
-                            reply_markup=reply_markup,
-                        )
-                    else:
-                        raise
-                await context.bot.edit_message_caption(
-                    chat_id=query.message.chat_id,
-                    message_id=query.message.message_id,
-                    caption=reply_message,
-                    reply_markup=reply_markup,
+                await self._render_result(
+                    query.message,
+                    convo["type"],
+                    r,
+                    cid,
+                    i - 1,
+                    len(convo["results"]),
                 )
             elif convo["type"] == "users":
                 if i <= 0:
@@ -849,32 +888,13 @@ class Searcharr(object):
                     return
                 r = convo["results"][i + 1]
                 logger.debug(f"{r=}")
-                reply_message, reply_markup = self._prepare_response(
-                    convo["type"], r, cid, i + 1, len(convo["results"])
-                )
-                try:
-                    await query.message.edit_media(
-                        media=InputMediaPhoto(r["remotePoster"]),
-                        reply_markup=reply_markup,
-                    )
-                except BadRequest as e:
-                    if str(e) in self._bad_request_poster_error_messages:
-                        logger.error(
-                            f"Error sending photo [{r['remotePoster']}]: BadRequest: {e}. Attempting to send with default poster..."
-                        )
-                        await query.message.edit_media(
-                            media=InputMediaPhoto(
-                                "https://artworks.thetvdb.com/banners/images/missing/movie.jpg"
-                            ),
-                            reply_markup=reply_markup,
-                        )
-                    else:
-                        raise
-                await context.bot.edit_message_caption(
-                    chat_id=query.message.chat_id,
-                    message_id=query.message.message_id,
-                    caption=reply_message,
-                    reply_markup=reply_markup,
+                await self._render_result(
+                    query.message,
+                    convo["type"],
+                    r,
+                    cid,
+                    i + 1,
+                    len(convo["results"]),
                 )
             elif convo["type"] == "users":
                 if i > len(convo["results"]):
@@ -895,8 +915,7 @@ class Searcharr(object):
                 )
         elif op == "add":
             r = convo["results"][i]
-            additional_data = self._get_add_data(cid)
-            logger.debug(f"{additional_data=}")
+            logger.debug(f"{add_data=}")
             paths = (
                 self.sonarr._root_folders
                 if convo["type"] == "series"
@@ -906,9 +925,10 @@ class Searcharr(object):
                 if convo["type"] == "book"
                 else []
             )
-            if not additional_data.get("p"):
+            if not add_data.get("p"):
                 if len(paths) > 1:
-                    reply_message, reply_markup = self._prepare_response(
+                    await self._render_result(
+                        query.message,
                         convo["type"],
                         r,
                         cid,
@@ -917,39 +937,15 @@ class Searcharr(object):
                         add=True,
                         paths=paths,
                     )
-                    try:
-                        await query.message.edit_media(
-                            media=InputMediaPhoto(r["remotePoster"]),
-                            reply_markup=reply_markup,
-                        )
-                    except BadRequest as e:
-                        if str(e) in self._bad_request_poster_error_messages:
-                            logger.error(
-                                f"Error sending photo [{r['remotePoster']}]: BadRequest: {e}. Attempting to send with default poster..."
-                            )
-                            await query.message.edit_media(
-                                media=InputMediaPhoto(
-                                    "https://artworks.thetvdb.com/banners/images/missing/movie.jpg"
-                                ),
-                                reply_markup=reply_markup,
-                            )
-                        else:
-                            raise
-                    await context.bot.edit_message_caption(
-                        chat_id=query.message.chat_id,
-                        message_id=query.message.message_id,
-                        caption=reply_message,
-                        reply_markup=reply_markup,
-                    )
                     await query.answer()
                     return
                 elif len(paths) == 1:
                     logger.debug(
                         f"Only one root folder enabled. Adding/Updating additional data for cid=[{cid}], key=[p], value=[{paths[0]['id']}]..."
                     )
-                    self._update_add_data(cid, "p", paths[0]["path"])
+                    add_data["p"] = paths[0]["path"]
                 else:
-                    self._delete_conversation(cid)
+                    await self._delete_conversation(cid)
                     await query.message.reply_text(
                         self._xlate(
                             "no_root_folders",
@@ -968,7 +964,7 @@ class Searcharr(object):
                     return
             else:
                 try:
-                    int(additional_data.get("p"))
+                    int(add_data.get("p"))
                 except ValueError:
                     # Value is already the full path
                     pass
@@ -978,17 +974,17 @@ class Searcharr(object):
                         (
                             p["path"]
                             for p in paths
-                            if p["id"] == int(additional_data["p"])
+                            if p["id"] == int(add_data["p"])
                         ),
                         None,
                     )
                     logger.debug(
-                        f"Path id [{additional_data['p']}] lookup result: [{path}]"
+                        f"Path id [{add_data['p']}] lookup result: [{path}]"
                     )
                     if path:
-                        self._update_add_data(cid, "p", path)
+                        add_data["p"] = path
 
-            if not additional_data.get("q"):
+            if not add_data.get("q"):
                 quality_profiles = (
                     self.sonarr._quality_profiles
                     if convo["type"] == "series"
@@ -998,7 +994,8 @@ class Searcharr(object):
                 )
                 if len(quality_profiles) > 1:
                     # prepare response to prompt user to select quality profile, and return
-                    reply_message, reply_markup = self._prepare_response(
+                    await self._render_result(
+                        query.message,
                         convo["type"],
                         r,
                         cid,
@@ -1007,39 +1004,15 @@ class Searcharr(object):
                         add=True,
                         quality_profiles=quality_profiles,
                     )
-                    try:
-                        await query.message.edit_media(
-                            media=InputMediaPhoto(r["remotePoster"]),
-                            reply_markup=reply_markup,
-                        )
-                    except BadRequest as e:
-                        if str(e) in self._bad_request_poster_error_messages:
-                            logger.error(
-                                f"Error sending photo [{r['remotePoster']}]: BadRequest: {e}. Attempting to send with default poster..."
-                            )
-                            await query.message.edit_media(
-                                media=InputMediaPhoto(
-                                    "https://artworks.thetvdb.com/banners/images/missing/movie.jpg"
-                                ),
-                                reply_markup=reply_markup,
-                            )
-                        else:
-                            raise
-                    await context.bot.edit_message_caption(
-                        chat_id=query.message.chat_id,
-                        message_id=query.message.message_id,
-                        caption=reply_message,
-                        reply_markup=reply_markup,
-                    )
                     await query.answer()
                     return
                 elif len(quality_profiles) == 1:
                     logger.debug(
                         f"Only one quality profile enabled. Adding/Updating additional data for cid=[{cid}], key=[q], value=[{quality_profiles[0]['id']}]..."
                     )
-                    self._update_add_data(cid, "q", quality_profiles[0]["id"])
+                    add_data["q"] = quality_profiles[0]["id"]
                 else:
-                    self._delete_conversation(cid)
+                    await self._delete_conversation(cid)
                     await query.message.reply_text(
                         self._xlate(
                             "no_quality_profiles",
@@ -1055,11 +1028,12 @@ class Searcharr(object):
                     await query.answer()
                     return
 
-            if convo["type"] == "book" and not additional_data.get("m"):
+            if convo["type"] == "book" and not add_data.get("m"):
                 metadata_profiles = self.readarr._metadata_profiles
                 if len(metadata_profiles) > 1:
                     # prepare response to prompt user to select quality profile, and return
-                    reply_message, reply_markup = self._prepare_response(
+                    await self._render_result(
+                        query.message,
                         convo["type"],
                         r,
                         cid,
@@ -1068,39 +1042,15 @@ class Searcharr(object):
                         add=True,
                         metadata_profiles=metadata_profiles,
                     )
-                    try:
-                        await query.message.edit_media(
-                            media=InputMediaPhoto(r["remotePoster"]),
-                            reply_markup=reply_markup,
-                        )
-                    except BadRequest as e:
-                        if str(e) in self._bad_request_poster_error_messages:
-                            logger.error(
-                                f"Error sending photo [{r['remotePoster']}]: BadRequest: {e}. Attempting to send with default poster..."
-                            )
-                            await query.message.edit_media(
-                                media=InputMediaPhoto(
-                                    "https://artworks.thetvdb.com/banners/images/missing/movie.jpg"
-                                ),
-                                reply_markup=reply_markup,
-                            )
-                        else:
-                            raise
-                    await context.bot.edit_message_caption(
-                        chat_id=query.message.chat_id,
-                        message_id=query.message.message_id,
-                        caption=reply_message,
-                        reply_markup=reply_markup,
-                    )
                     await query.answer()
                     return
                 elif len(metadata_profiles) == 1:
                     logger.debug(
                         f"Only one metadata profile enabled. Adding/Updating additional data for cid=[{cid}], key=[m], value=[{metadata_profiles[0]['id']}]..."
                     )
-                    self._update_add_data(cid, "m", metadata_profiles[0]["id"])
+                    add_data["m"] = metadata_profiles[0]["id"]
                 else:
-                    self._delete_conversation(cid)
+                    await self._delete_conversation(cid)
                     await query.message.reply_text(
                         self._xlate(
                             "no_metadata_profiles",
@@ -1119,7 +1069,7 @@ class Searcharr(object):
             if (
                 convo["type"] == "series"
                 and settings.sonarr_season_monitor_prompt
-                and additional_data.get("m", False) is False
+                and add_data.get("m", False) is False
             ):
                 # m = monitor season(s)
                 monitor_options = [
@@ -1128,7 +1078,8 @@ class Searcharr(object):
                     self._xlate("latest_season"),
                 ]
                 # prepare response to prompt user to select quality profile, and return
-                reply_message, reply_markup = self._prepare_response(
+                await self._render_result(
+                    query.message,
                     convo["type"],
                     r,
                     cid,
@@ -1137,61 +1088,38 @@ class Searcharr(object):
                     add=True,
                     monitor_options=monitor_options,
                 )
-                try:
-                    await query.message.edit_media(
-                        media=InputMediaPhoto(r["remotePoster"]),
-                        reply_markup=reply_markup,
-                    )
-                except BadRequest as e:
-                    if str(e) in self._bad_request_poster_error_messages:
-                        logger.error(
-                            f"Error sending photo [{r['remotePoster']}]: BadRequest: {e}. Attempting to send with default poster..."
-                        )
-                        await query.message.edit_media(
-                            media=InputMediaPhoto(
-                                "https://artworks.thetvdb.com/banners/images/missing/movie.jpg"
-                            ),
-                            reply_markup=reply_markup,
-                        )
-                    else:
-                        raise
-                await context.bot.edit_message_caption(
-                    chat_id=query.message.chat_id,
-                    message_id=query.message.message_id,
-                    caption=reply_message,
-                    reply_markup=reply_markup,
-                )
                 await query.answer()
                 return
 
             if convo["type"] == "series":
-                all_tags = self.sonarr.get_filtered_tags(
+                all_tags = await self.sonarr.get_filtered_tags(
                     settings.sonarr_user_selectable_tags,
                     settings.sonarr_forced_tags,
                 )
                 allow_user_to_select_tags = settings.sonarr_allow_user_to_select_tags
                 forced_tags = settings.sonarr_forced_tags
             elif convo["type"] == "movie":
-                all_tags = self.radarr.get_filtered_tags(
+                all_tags = await self.radarr.get_filtered_tags(
                     settings.radarr_user_selectable_tags,
                     settings.radarr_forced_tags,
                 )
                 allow_user_to_select_tags = settings.radarr_allow_user_to_select_tags
                 forced_tags = settings.radarr_forced_tags
             elif convo["type"] == "book":
-                all_tags = self.readarr.get_filtered_tags(
+                all_tags = await self.readarr.get_filtered_tags(
                     settings.readarr_user_selectable_tags,
                     settings.readarr_forced_tags,
                 )
                 allow_user_to_select_tags = settings.readarr_allow_user_to_select_tags
                 forced_tags = settings.readarr_forced_tags
-            if allow_user_to_select_tags and not additional_data.get("td"):
+            if allow_user_to_select_tags and not add_data.get("td"):
                 if not len(all_tags):
                     logger.warning(
                         f"User tagging is enabled, but no tags found. Make sure there are tags{' in Sonarr' if convo['type'] == 'series' else ' in Radarr' if convo['type'] == 'movie' else ' in Readarr' if convo['type'] == 'book' else ''} matching your Searcharr configuration."
                     )
-                elif not additional_data.get("tt"):
-                    reply_message, reply_markup = self._prepare_response(
+                elif not add_data.get("tt"):
+                    await self._render_result(
+                        query.message,
                         convo["type"],
                         r,
                         cid,
@@ -1200,98 +1128,78 @@ class Searcharr(object):
                         add=True,
                         tags=all_tags,
                     )
-                    try:
-                        await query.message.edit_media(
-                            media=InputMediaPhoto(r["remotePoster"]),
-                            reply_markup=reply_markup,
-                        )
-                    except BadRequest as e:
-                        if str(e) in self._bad_request_poster_error_messages:
-                            logger.error(
-                                f"Error sending photo [{r['remotePoster']}]: BadRequest: {e}. Attempting to send with default poster..."
-                            )
-                            await query.message.edit_media(
-                                media=InputMediaPhoto(
-                                    "https://artworks.thetvdb.com/banners/images/missing/movie.jpg"
-                                ),
-                                reply_markup=reply_markup,
-                            )
-                        else:
-                            raise
-                    await context.bot.edit_message_caption(
-                        chat_id=query.message.chat_id,
-                        message_id=query.message.message_id,
-                        caption=reply_message,
-                        reply_markup=reply_markup,
-                    )
                     await query.answer()
                     return
                 else:
                     tag_ids = (
-                        additional_data.get("t", "").split(",")
-                        if len(additional_data.get("t", ""))
+                        add_data.get("t", "").split(",")
+                        if len(add_data.get("t", ""))
                         else []
                     )
-                    tag_ids.append(additional_data["tt"])
-                    logger.debug(f"Adding tag [{additional_data['tt']}]")
-                    self._update_add_data(cid, "t", ",".join(tag_ids))
+                    tag_ids.append(add_data["tt"])
+                    logger.debug(f"Adding tag [{add_data['tt']}]")
+                    add_data["t"] = ",".join(tag_ids)
                     return
 
             tags = (
-                additional_data.get("t").split(",")
-                if len(additional_data.get("t", ""))
+                add_data.get("t").split(",")
+                if len(add_data.get("t", ""))
                 else []
             )
             logger.debug(f"{tags=}")
             if convo["type"] == "series":
-                get_tag_id = self.sonarr.get_tag_id
+                get_tag_ids = self.sonarr.get_tag_ids
                 tag_with_username = settings.sonarr_tag_with_username
             elif convo["type"] == "movie":
-                get_tag_id = self.radarr.get_tag_id
+                get_tag_ids = self.radarr.get_tag_ids
                 tag_with_username = settings.radarr_tag_with_username
             elif convo["type"] == "book":
-                get_tag_id = self.readarr.get_tag_id
+                get_tag_ids = self.readarr.get_tag_ids
                 tag_with_username = settings.readarr_tag_with_username
+            username_tag = f"searcharr-{query.from_user.username if query.from_user.username else query.from_user.id}"
+            tag_ids = await get_tag_ids(
+                ([username_tag] if tag_with_username else []) + list(forced_tags)
+            )
             if tag_with_username:
-                tag = f"searcharr-{query.from_user.username if query.from_user.username else query.from_user.id}"
-                if tag_id := get_tag_id(tag):
+                tag = username_tag
+                if tag_id := tag_ids.get(tag):
                     tags.append(str(tag_id))
                 else:
                     self.logger.warning(
                         f"Tag lookup/creation failed for [{tag}]. This tag will not be added to the {convo['type']}."
                     )
             for tag in forced_tags:
-                if tag_id := get_tag_id(tag):
+                if tag_id := tag_ids.get(tag):
                     tags.append(str(tag_id))
                 else:
                     self.logger.warning(
                         f"Tag lookup/creation failed for forced tag [{tag}]. This tag will not be added to the {convo['type']}."
                     )
-            self._update_add_data(cid, "t", ",".join(list(set(tags))))
+            add_data["t"] = ",".join(list(set(tags)))
 
             logger.debug("All data is accounted for, proceeding to add...")
             try:
                 if convo["type"] == "series":
-                    added = self.sonarr.add_series(
+                    added = await self.sonarr.add_series(
                         series_info=r,
                         monitored=settings.sonarr_add_monitored,
                         search=settings.sonarr_search_on_add,
-                        additional_data=self._get_add_data(cid),
+                        additional_data=add_data,
                     )
                 elif convo["type"] == "movie":
-                    added = self.radarr.add_movie(
+                    added = await self.radarr.add_movie(
                         movie_info=r,
                         monitored=settings.radarr_add_monitored,
                         search=settings.radarr_search_on_add,
                         min_avail=settings.radarr_min_availability,
-                        additional_data=self._get_add_data(cid),
+                        additional_data=add_data,
                     )
                 elif convo["type"] == "book":
-                    added = self.readarr.add_book(
+                    added = await self.readarr.add_book(
                         book_info=r,
                         monitored=settings.readarr_add_monitored,
                         search=settings.readarr_search_on_add,
-                        additional_data=self._get_add_data(cid),
+                        additional_data=add_data,
                     )
                 else:
                     added = False
@@ -1300,11 +1208,11 @@ class Searcharr(object):
                 added = False
             logger.debug(f"Result of attempt to add {convo['type']}: {added}")
             if added:
-                self._delete_conversation(cid)
+                await self._delete_conversation(cid)
                 await query.message.reply_text(self._xlate("added", title=r["title"]))
                 await query.message.delete()
                 # Log the request to history
-                self._log_request(
+                await self._log_request(
                     user_id=query.from_user.id,
                     username=query.from_user.username,
                     request_type=convo["type"],
@@ -1334,14 +1242,14 @@ class Searcharr(object):
                 await query.answer()
                 return
             try:
-                self._remove_user(i)
+                await self._remove_user(i)
                 # await query.message.reply_text(
                 #    f"Successfully removed all access for user id [{i}]!"
                 # )
                 # self._delete_conversation(cid)
                 # await query.message.delete()
-                convo.update({"results": self._get_users()})
-                self._create_conversation(
+                convo.update({"results": await self._get_users()})
+                await self._create_conversation(
                     id=cid,
                     username=str(query.message.from_user.username),
                     kind="users",
@@ -1382,12 +1290,12 @@ class Searcharr(object):
                 await query.answer()
                 return
             try:
-                self._update_admin_access(i, 1)
+                await self._update_admin_access(i, 1)
                 # await query.message.reply_text(f"Added admin access for user id [{i}]!")
                 # self._delete_conversation(cid)
                 # await query.message.delete()
-                convo.update({"results": self._get_users()})
-                self._create_conversation(
+                convo.update({"results": await self._get_users()})
+                await self._create_conversation(
                     id=cid,
                     username=str(query.message.from_user.username),
                     kind="users",
@@ -1428,12 +1336,12 @@ class Searcharr(object):
                 await query.answer()
                 return
             try:
-                self._update_admin_access(i, "")
+                await self._update_admin_access(i, "")
                 # await query.message.reply_text(f"Removed admin access for user id [{i}]!")
                 # self._delete_conversation(cid)
                 # await query.message.delete()
-                convo.update({"results": self._get_users()})
-                self._create_conversation(
+                convo.update({"results": await self._get_users()})
+                await self._create_conversation(
                     id=cid,
                     username=str(query.message.from_user.username),
                     kind="users",
@@ -1460,13 +1368,13 @@ class Searcharr(object):
         elif op == "search":
             r = convo["results"][i]
             if convo["type"] == "series" and r["id"]:
-                result = self.sonarr.search_series(r["id"])
+                result = await self.sonarr.search_series(r["id"])
                 if result:
                     await query.message.reply_text(self._xlate("search_triggered", kind=self._xlate("series").title()))
                 else:
                     await query.message.reply_text(self._xlate("search_failed", kind=self._xlate("series").title()))
             elif convo["type"] == "movie" and r["id"]:
-                result = self.radarr.search_movie(r["id"])
+                result = await self.radarr.search_movie(r["id"])
                 if result:
                     await query.message.reply_text(self._xlate("search_triggered", kind=self._xlate("movie").title()))
                 else:
@@ -1480,10 +1388,10 @@ class Searcharr(object):
             matches = ytdl_helper.find_media_matches(title, threshold=0.50, max_results=5)
             matched_path = matches[0][1] if matches else None
             if matched_path:
-                self._update_add_data(cid, "ytdl_path", str(matched_path))
+                add_data["ytdl_path"] = str(matched_path)
             # Store each match path individually (database only accepts strings)
             for idx, (kind, path) in enumerate(matches):
-                self._update_add_data(cid, f"ytdl_match_{idx}", str(path))
+                add_data[f"ytdl_match_{idx}"] = str(path)
             text, markup = self._prepare_ytdl_dest(cid, i, title, matches)
             await context.bot.edit_message_text(
                 chat_id=query.message.chat.id,
@@ -1526,10 +1434,10 @@ class Searcharr(object):
                     f"Proceed with this folder name?"
                 )
             
-            # Store season in conversation for confirm handler (use _update_add_data to persist)
+            # Store season in conversation for confirm handler
             logger.info(f"ytfill storing: season={season}, folder={matched_folder}")
-            self._update_add_data(cid, "ytfill_season", str(season))
-            self._update_add_data(cid, "ytfill_folder", matched_folder)
+            add_data["ytfill_season"] = str(season)
+            add_data["ytfill_folder"] = matched_folder
             
             confirm_keyboard = InlineKeyboardMarkup([
                 [
@@ -1547,11 +1455,10 @@ class Searcharr(object):
 
         elif op == "ytfill_confirm" and convo["type"] == "ytfill":
             show_name = convo["results"][0] if convo.get("results") else ""
-            add_data = self._get_add_data(cid)
             season = int(add_data.get("ytfill_season", "1"))
             folder = add_data.get("ytfill_folder", "")
             logger.info(f"ytfill_confirm: season={season}, folder={folder}")
-            self._delete_conversation(cid)
+            await self._delete_conversation(cid)
             await context.bot.edit_message_text(
                 chat_id=query.message.chat.id,
                 message_id=query.message.message_id,
@@ -1562,7 +1469,7 @@ class Searcharr(object):
             self._ytfill_tasks[show_name] = task
 
         elif op == "ytfill_cancel" and convo["type"] == "ytfill":
-            self._delete_conversation(cid)
+            await self._delete_conversation(cid)
             await context.bot.edit_message_text(
                 chat_id=query.message.chat.id,
                 message_id=query.message.message_id,
@@ -1585,7 +1492,6 @@ class Searcharr(object):
         elif op == "ytdl_tv_episode" and convo["type"] == "ytdl":
             r = convo["results"][i]
             title = r.get("title", "")
-            add_data = self._get_add_data(cid)
             season = int(add_data.get("season", op_flags.get("season", 1)))
             offset = int(op_flags.get("ep_offset", add_data.get("ep_offset", 0)))
             text, markup = self._prepare_ytdl_episode_keyboard(cid, i, title, season, offset)
@@ -1601,7 +1507,6 @@ class Searcharr(object):
             r = convo["results"][i]
             title = r.get("title", "")
             url = f"https://www.youtube.com/watch?v={r['id']}"
-            add_data = self._get_add_data(cid)
             dest = op_flags.get("dest", add_data.get("dest", "movie"))
 
             from pathlib import Path as _Path
@@ -1619,7 +1524,7 @@ class Searcharr(object):
                         show_dir = _Path(match_path)
                     else:
                         _clean = ytdl_helper.clean_title(title)
-                        _canonical = ytdl_helper.lookup_canonical_series_name(_clean, self.sonarr) if self.sonarr else None
+                        _canonical = await self._lookup_canonical_name("series", _clean)
                         show_dir = ytdl_helper.TV_ROOT / (_canonical or _clean)
                 else:
                     # Strip episode tokens so YouTube "Show S01E01 HD" → folder "Show"
@@ -1632,7 +1537,7 @@ class Searcharr(object):
                         "",
                         raw,
                     ).strip(" -")
-                    canonical_show = ytdl_helper.lookup_canonical_series_name(show_name or raw, self.sonarr) if self.sonarr else None
+                    canonical_show = await self._lookup_canonical_name("series", show_name or raw)
                     show_dir = ytdl_helper.TV_ROOT / (canonical_show or show_name or raw)
                 output_dir = show_dir / f"Season {season_int:02d}"
                 folder_name = f"{show_dir.name} - S{season_int:02d}E{ep_int:02d}"
@@ -1644,7 +1549,7 @@ class Searcharr(object):
                     output_dir = _Path(match_path)
                 else:
                     _clean = ytdl_helper.clean_title(title)
-                    _canonical = ytdl_helper.lookup_canonical_movie_name(_clean, self.radarr) if self.radarr else None
+                    _canonical = await self._lookup_canonical_name("movie", _clean)
                     output_dir = ytdl_helper.MOVIE_ROOT / (_canonical or _clean)
                 folder_name = output_dir.name
             elif dest == "auto" and add_data.get("ytdl_path"):
@@ -1652,15 +1557,15 @@ class Searcharr(object):
                 folder_name = output_dir.name
             elif dest == "tv":
                 clean = ytdl_helper.clean_title(title)
-                canonical = ytdl_helper.lookup_canonical_series_name(clean, self.sonarr) if self.sonarr else None
+                canonical = await self._lookup_canonical_name("series", clean)
                 folder_name = canonical or clean
                 output_dir = ytdl_helper.TV_ROOT / folder_name
             else:
                 clean = ytdl_helper.clean_title(title)
-                canonical = ytdl_helper.lookup_canonical_movie_name(clean, self.radarr) if self.radarr else None
+                canonical = await self._lookup_canonical_name("movie", clean)
                 folder_name = canonical or clean
                 output_dir = ytdl_helper.MOVIE_ROOT / folder_name
-            self._delete_conversation(cid)
+            await self._delete_conversation(cid)
 
             await context.bot.edit_message_text(
                 chat_id=query.message.chat.id,
@@ -1682,6 +1587,7 @@ class Searcharr(object):
                         chat_id=chat_id,
                         text=f"✅ *{ytdl_helper.clean_title(title)}* downloaded!\nSaved to: `{dest_path}`",
                         parse_mode="Markdown",
+                        rate_limit_args={"priority": ratelimit.NOTIFICATION},
                     )
                     # Add to Radarr/Sonarr so it gets proper metadata and is monitored
                     try:
@@ -1690,7 +1596,7 @@ class Searcharr(object):
                         year_match = _re.search(r'\((\d{4})\)', output_dir.name)
                         year = int(year_match.group(1)) if year_match else 0
                         if not is_tv_ep and self.radarr:
-                            self.radarr.add_movie_by_title(
+                            await self.radarr.add_movie_by_title(
                                 clean, year, str(ytdl_helper.MOVIE_ROOT)
                             )
                     except Exception as add_err:
@@ -1699,9 +1605,9 @@ class Searcharr(object):
                     # Trigger folder scan so Radarr/Sonarr links the file
                     try:
                         if is_tv_ep and self.sonarr:
-                            self.sonarr.scan_folder(str(output_dir))
+                            await self.sonarr.scan_folder(str(output_dir))
                         elif not is_tv_ep and self.radarr:
-                            self.radarr.scan_folder(str(output_dir))
+                            await self.radarr.scan_folder(str(output_dir))
                     except Exception as scan_err:
                         logger.warning(f"Folder scan trigger failed (non-fatal): {scan_err}")
                 except Exception as e:
@@ -1709,6 +1615,7 @@ class Searcharr(object):
                     await context.bot.send_message(
                         chat_id=chat_id,
                         text=f"❌ Download failed: {str(e)[:300]}",
+                        rate_limit_args={"priority": ratelimit.NOTIFICATION},
                     )
 
             asyncio.create_task(_do_download())
@@ -1953,6 +1860,15 @@ class Searcharr(object):
         except Exception as e:
             logger.debug(f"Could not answer callback query in error handler: {e}")
 
+    async def _lookup_canonical_name(self, kind, title):
+        if kind == "series":
+            if not self.sonarr:
+                return None
+            return await ytdl_helper.lookup_canonical_series_name(title, self.sonarr)
+        if not self.radarr:
+            return None
+        return await ytdl_helper.lookup_canonical_movie_name(title, self.radarr)
+
     def _prepare_ytdl_list(self, results, cid):
         keyboard = []
         for i, entry in enumerate(results):
@@ -2045,7 +1961,7 @@ class Searcharr(object):
 
     async def cmd_youtube(self, update, context):
         logger.debug(f"Received youtube cmd from [{update.message.from_user.username}]")
-        if not self._authenticated(update.message.from_user.id):
+        if not await self._authenticated(update.message.from_user.id):
             await update.message.reply_text(
                 self._xlate(
                     "auth_required",
@@ -2081,7 +1997,7 @@ class Searcharr(object):
             return
 
         cid = self._generate_cid()
-        self._create_conversation(
+        await self._create_conversation(
             id=cid,
             username=str(update.message.from_user.username),
             kind="ytdl",
@@ -2092,7 +2008,7 @@ class Searcharr(object):
 
     async def cmd_ytfill(self, update, context):
         logger.debug(f"Received ytfill cmd from [{update.message.from_user.username}]")
-        if not self._authenticated(update.message.from_user.id):
+        if not await self._authenticated(update.message.from_user.id):
             await update.message.reply_text(
                 self._xlate(
                     "auth_required",
@@ -2115,7 +2031,7 @@ class Searcharr(object):
             return
 
         cid = self._generate_cid()
-        self._create_conversation(
+        await self._create_conversation(
             id=cid,
             username=str(update.message.from_user.username),
             kind="ytfill",
@@ -2131,7 +2047,7 @@ class Searcharr(object):
     async def cmd_ytfillstop(self, update, context):
         """Stop an active ytfill download."""
         logger.debug(f"Received ytfillstop cmd from [{update.message.from_user.username}]")
-        if not self._authenticated(update.message.from_user.id):
+        if not await self._authenticated(update.message.from_user.id):
             await update.message.reply_text(
                 self._xlate(
                     "auth_required",
@@ -2266,6 +2182,7 @@ class Searcharr(object):
                         chat_id=chat_id,
                         text=f"✅ *{show_clean}* Ep {ep:03d} downloaded",
                         parse_mode="Markdown",
+                        rate_limit_args={"priority": ratelimit.NOTIFICATION},
                     )
                 except Exception as e:
                     label = f"Ep {ep:03d}"
@@ -2310,6 +2227,7 @@ class Searcharr(object):
                             chat_id=chat_id,
                             text=f"✅ *{show_clean}* S{season:02d}E{ep:02d} downloaded",
                             parse_mode="Markdown",
+                            rate_limit_args={"priority": ratelimit.NOTIFICATION},
                         )
                     except Exception as e:
                         label = f"S{season:02d}E{ep:02d}"
@@ -2326,7 +2244,7 @@ class Searcharr(object):
         # Trigger Sonarr scan on the whole show folder
         if self.sonarr:
             try:
-                self.sonarr.scan_folder(str(show_dir))
+                await self.sonarr.scan_folder(str(show_dir))
             except Exception as e:
                 logger.warning(f"ytfill Sonarr scan failed (non-fatal): {e}")
 
@@ -2335,11 +2253,16 @@ class Searcharr(object):
             summary += f"\n⚠️ {len(failed)} failed: {', '.join(failed[:15])}"
         if downloaded == 0:
             summary += "\n\nNo episodes found on YouTube. Try a different show name spelling."
-        await context.bot.send_message(chat_id=chat_id, text=summary, parse_mode="Markdown")
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=summary,
+            parse_mode="Markdown",
+            rate_limit_args={"priority": ratelimit.NOTIFICATION},
+        )
 
     async def cmd_help(self, update, context):
         logger.debug(f"Received help cmd from [{update.message.from_user.username}]")
-        auth_level = self._authenticated(update.message.from_user.id)
+        auth_level = await self._authenticated(update.message.from_user.id)
         if not auth_level:
             await update.message.reply_text(
                 self._xlate(
@@ -2436,7 +2359,7 @@ class Searcharr(object):
     async def cmd_myrequests(self, update, context):
         """Show user's request history."""
         logger.debug(f"Received myrequests cmd from [{update.message.from_user.username}]")
-        auth_level = self._authenticated(update.message.from_user.id)
+        auth_level = await self._authenticated(update.message.from_user.id)
         if not auth_level:
             await update.message.reply_text(
                 self._xlate(
@@ -2451,24 +2374,19 @@ class Searcharr(object):
             )
             return
         
-        con, cur = self._get_con_cur()
         try:
-            with DBLOCK:
-                cur.execute(
-                    """SELECT request_type, title, status, created_at 
-                       FROM request_history 
-                       WHERE user_id = ? 
-                       ORDER BY created_at DESC 
-                       LIMIT 10""",
-                    (update.message.from_user.id,)
-                )
-                requests = cur.fetchall()
+            requests = await self._db.fetchall(
+                """SELECT request_type, title, status, created_at 
+                   FROM request_history 
+                   WHERE user_id = ? 
+                   ORDER BY created_at DESC 
+                   LIMIT 10""",
+                (update.message.from_user.id,)
+            )
         except sqlite3.Error as e:
             logger.error(f"Error fetching request history: {e}")
             await update.message.reply_text("Error fetching request history.")
             return
-        finally:
-            con.close()
         
         if not requests:
             await update.message.reply_text("📋 You haven't made any requests yet!")
@@ -2505,74 +2423,114 @@ class Searcharr(object):
         
         await update.message.reply_text("\n".join(lines))
 
-    def _check_rate_limit(self, user_id):
+    def _check_rate_limit(self, user_id, command=None):
         """Check if user has exceeded rate limit. Returns True if allowed, False if limited."""
-        max_requests = getattr(settings, "rate_limit_requests", 20)  # Default 20 requests
-        window_seconds = getattr(settings, "rate_limit_window", 60)  # Default 1 minute
-        
-        con, cur = self._get_con_cur()
+        return self._rate_limiter.allow(user_id, command)
+
+    async def _load_rate_limits(self):
+        q = "SELECT user_id, tokens_used, tokens_saved_at FROM rate_limits WHERE tokens_used IS NOT NULL;"
+        logger.debug(f"Executing query: [{q}] with no args...")
         try:
-            with DBLOCK:
-                cur.execute(
-                    "SELECT request_count, window_start FROM rate_limits WHERE user_id = ?",
-                    (user_id,)
-                )
-                row = cur.fetchone()
-                
-                current_time = datetime.now()
-                
-                if row:
-                    count, window_start = row["request_count"], row["window_start"]
-                    window_start = datetime.fromisoformat(window_start) if isinstance(window_start, str) else window_start
-                    
-                    # Check if window has expired
-                    if (current_time - window_start).total_seconds() > window_seconds:
-                        # Reset window
-                        cur.execute(
-                            "UPDATE rate_limits SET request_count = 1, window_start = ? WHERE user_id = ?",
-                            (current_time.isoformat(), user_id)
-                        )
-                        con.commit()
-                        return True
-                    elif count >= max_requests:
-                        return False
-                    else:
-                        cur.execute(
-                            "UPDATE rate_limits SET request_count = request_count + 1 WHERE user_id = ?",
-                            (user_id,)
-                        )
-                        con.commit()
-                        return True
-                else:
-                    # New user, create entry
-                    cur.execute(
-                        "INSERT INTO rate_limits (user_id, request_count, window_start) VALUES (?, 1, ?)",
-                        (user_id, current_time.isoformat())
-                    )
-                    con.commit()
-                    return True
+            records = await self._db.fetchall(q)
         except sqlite3.Error as e:
-            logger.error(f"Error checking rate limit: {e}")
-            return True  # Allow on error
-        finally:
-            con.close()
+            logger.error(f"Error loading rate limits from the database [{q}]: {e}")
+            return
+
+        self._rate_limiter.restore(
+            (x["user_id"], x["tokens_used"], x["tokens_saved_at"]) for x in records
+        )
+
+    async def _save_rate_limits(self):
+        # Persist the buckets that changed since the last snapshot so limits survive restarts
+        rows = self._rate_limiter.snapshot()
+        if not rows:
+            return
+        q = """INSERT INTO rate_limits (user_id, tokens_used, tokens_saved_at) VALUES (?, ?, ?)
+               ON CONFLICT (user_id) DO UPDATE
+               SET tokens_used=excluded.tokens_used, tokens_saved_at=excluded.tokens_saved_at;"""
+        logger.debug(f"Saving {len(rows)} rate limit buckets to the database")
+        try:
+            await self._db.write(lambda con, cur: cur.executemany(q, rows))
+        except sqlite3.Error as e:
+            logger.error(f"Error saving rate limits to the database [{q}]: {e}")
+
+    def _start_periodic(self, name, interval, fn, delay=None):
+        # Run an async housekeeping job every interval seconds (the first time
+        # after delay seconds, if given) until shutdown
+        async def loop():
+            await asyncio.sleep(interval if delay is None else delay)
+            while True:
+                try:
+                    await fn()
+                except Exception as e:
+                    logger.error(f"Error running {name}: {e}")
+                await asyncio.sleep(interval)
 
-    def _log_request(self, user_id, username, request_type, title, tmdb_id=None, tvdb_id=None, status="pending"):
-        """Log a request to history."""
-        con, cur = self._get_con_cur()
+        self._background_tasks.append(asyncio.create_task(loop(), name=name))
+
+    async def _maintain_db(self):
+        start = time.monotonic()
         try:
-            with DBLOCK:
-                cur.execute(
-                    """INSERT INTO request_history 
-                       (user_id, username, request_type, title, tmdb_id, tvdb_id, status) 
-                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                    (user_id, username, request_type, title, tmdb_id, tvdb_id, status)
-                )
-                con.commit()
+            before, after = await self._db.maintain()
+        except sqlite3.Error as e:
+            logger.error(f"Error running database maintenance: {e}")
+            return
+        logger.info(
+            f"Database maintenance finished in {time.monotonic() - start:.2f}s: "
+            f"database {before['size']} -> {after['size']} bytes, "
+            f"WAL {before['wal']} -> {after['wal']} bytes, "
+            f"free space {before['free']} -> {after['free']} bytes"
+        )
+
+    async def _stop_background_tasks(self):
+        for task in self._background_tasks:
+            task.cancel()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        self._background_tasks = []
+
+    async def _log_request(self, user_id, username, request_type, title, tmdb_id=None, tvdb_id=None, status="pending"):
+        """Log a request to history and count it in today's rollup."""
+        def log(con, cur):
+            cur.execute(
+                """INSERT INTO request_history 
+                   (user_id, username, request_type, title, tmdb_id, tvdb_id, status) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (user_id, username, request_type, title, tmdb_id, tvdb_id, status)
+            )
+            cur.execute(
+                """INSERT INTO request_history_daily (day, user_id, request_type, status, count)
+                   VALUES (date('now'), ?, ?, ?, 1)
+                   ON CONFLICT (day, user_id, request_type, status) DO UPDATE SET count = count + 1""",
+                (user_id, request_type, status)
+            )
+
+        try:
+            await self._db.write(log)
         except sqlite3.Error as e:
             logger.error(f"Error logging request: {e}")
-        finally:
-            con.close()
+
+    async def _prune_request_history(self):
+        # Delete request history older than searcharr_request_history_retention_days.
+        # The daily rollups are kept, so totals survive the detail being deleted.
+        days = getattr(settings, "searcharr_request_history_retention_days", 365)
+        if not days:
+            return
+        q = """DELETE FROM request_history WHERE id IN (
+                   SELECT id FROM request_history WHERE created_at < datetime('now', ?) LIMIT ?
+               );"""
+        qa = (f"-{days} days", REQUEST_HISTORY_PRUNE_BATCH)
+        deleted = 0
+        try:
+            # Small batches so other writes aren't held up behind one huge delete
+            while True:
+                count = await self._db.execute(q, qa)
+                deleted += count
+                if count < REQUEST_HISTORY_PRUNE_BATCH:
+                    break
+        except sqlite3.Error as e:
+            logger.error(f"Error deleting old request history [{q}]: {e}")
+        if deleted:
+            logger.info(f"Deleted {deleted} requests older than {days} days from request history")
 
     def _strip_entities(self, message):
         text = message.text
@@ -2586,7 +2544,7 @@ class Searcharr(object):
 
     async def cmd_nowplaying(self, update, context):
         logger.debug(f"Received nowplaying cmd from [{update.message.from_user.username}]")
-        if not self._authenticated(update.message.from_user.id):
+        if not await self._authenticated(update.message.from_user.id):
             await update.message.reply_text(
                 self._xlate(
                     "auth_required",
@@ -2610,9 +2568,100 @@ class Searcharr(object):
         else:
             await update.message.reply_text(text, parse_mode="HTML")
 
+    async def _resolve_startup_tags(self):
+        # Look up (and create, if missing) the configured tags before handling
+        # any updates, so the first add does not have to create them. Each
+        # backend fetches its tag list once, and the backends run concurrently.
+        apps = [
+            (app, arr)
+            for app, arr in [
+                ("Sonarr", self.sonarr),
+                ("Radarr", self.radarr),
+                ("Readarr", self.readarr),
+            ]
+            if arr
+        ]
+        results = await asyncio.gather(
+            *[self._resolve_app_tags(app, arr) for app, arr in apps],
+            return_exceptions=True,
+        )
+        for (app, _), result in zip(apps, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error resolving configured {app} tags: {result}")
+
+    async def _resolve_app_tags(self, app, arr):
+        prefix = app.lower()
+        selectable = getattr(settings, f"{prefix}_user_selectable_tags")
+        forced = getattr(settings, f"{prefix}_forced_tags")
+        if not selectable and not forced:
+            return
+        tag_ids = await arr.get_tag_ids(list(selectable) + list(forced))
+        for t in selectable:
+            if t_id := tag_ids.get(t):
+                logger.debug(f"Tag id [{t_id}] for user-selectable {app} tag [{t}]")
+        for t in forced:
+            if t_id := tag_ids.get(t):
+                logger.debug(f"Tag id [{t_id}] for forced {app} tag [{t}]")
+
+    async def _close_arr_clients(self):
+        for arr in [self.sonarr, self.radarr, self.readarr]:
+            if arr:
+                await arr.aclose()
+
     async def run(self):
-        self._init_db()
-        application = Application.builder().token(self.token).build()
+        phase_start = time.monotonic()
+        await self._init_db()
+        await self._load_auth_cache()
+        await self._load_rate_limits()
+        await self._load_poster_cache()
+        self._startup_timings["database"] = time.monotonic() - phase_start
+        phase_start = time.monotonic()
+        await self._resolve_startup_tags()
+        self._startup_timings["tags"] = time.monotonic() - phase_start
+        self._log_startup_timings()
+        if interval := getattr(settings, "rate_limit_snapshot_interval", 60):
+            self._start_periodic(
+                "rate-limit-snapshot", interval, self._save_rate_limits
+            )
+        if interval := getattr(settings, "searcharr_conversation_sweep_interval", 3600):
+            self._start_periodic(
+                "conversation-sweep", interval, self._sweep_conversations
+            )
+        if getattr(settings, "searcharr_request_history_retention_days", 365):
+            # Shortly after startup as well as daily, so a bot restarted more
+            # often than once a day still prunes
+            self._start_periodic(
+                "request-history-retention",
+                86400,
+                self._prune_request_history,
+                delay=REQUEST_HISTORY_PRUNE_DELAY,
+            )
+        if (hour := getattr(settings, "searcharr_db_maintenance_hour", 4)) is not None:
+            # Daily at the configured (quiet) hour, local time
+            now = datetime.now()
+            next_run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+            if next_run <= now:
+                next_run += timedelta(days=1)
+            self._start_periodic(
+                "database-maintenance",
+                86400,
+                self._maintain_db,
+                delay=(next_run - now).total_seconds(),
+            )
+        rate_limiter = ratelimit.OutboundRateLimiter(
+            logger,
+            overall_rate=getattr(settings, "rate_limit_send_overall", 30),
+            chat_rate=getattr(settings, "rate_limit_send_per_chat", 1),
+            group_rate=getattr(settings, "rate_limit_send_per_group", 20) / 60,
+        )
+        builder = Application.builder().token(self.token).rate_limiter(rate_limiter)
+        concurrent_updates = getattr(settings, "searcharr_concurrent_updates", 8)
+        if concurrent_updates > 1:
+            # Updates from one user, or for one search, still run in order
+            builder.concurrent_updates(
+                update_processor.KeyedUpdateProcessor(concurrent_updates)
+            )
+        application = builder.build()
         self.application = application
         statusFile = StatusFinder()
         self.statusFile = statusFile  # Store StatusFinder for later use
@@ -2726,23 +2775,50 @@ class Searcharr(object):
                 "Developer mode is enabled; skipping registration of error handler--exceptions will be raised."
             )
 
-        # Start polling in a separate thread
+        # Receive updates by webhook if configured, otherwise poll for them
+        telegram_webhook_url = getattr(settings, "telegram_webhook_url", None)
+        use_webhook = getattr(settings, "telegram_webhook_enabled", False) and bool(telegram_webhook_url)
+        if getattr(settings, "telegram_webhook_enabled", False) and not use_webhook:
+            logger.error("telegram_webhook_enabled is set without telegram_webhook_url; falling back to polling")
+
         await application.initialize()
         await application.start()
-        await application.updater.start_polling()
 
-        # Start Plex webhook server if enabled
-        webhook_runner = None
+        # Plex and Telegram webhooks share one aiohttp server
+        webhook_app = web.Application()
         if getattr(settings, "plex_webhook_enabled", False):
+            plex_webhook.add_routes(
+                webhook_app,
+                bot=application.bot,
+                admin_ids=settings.admin_user_ids,
+                events=getattr(settings, "plex_webhook_events", None),
+            )
+        if use_webhook:
+            secret_token = getattr(settings, "telegram_webhook_secret", None) or telegram_webhook.new_secret()
+            telegram_webhook.add_routes(
+                webhook_app,
+                application,
+                path=getattr(settings, "telegram_webhook_path", "/telegram"),
+                secret_token=secret_token,
+            )
+
+        webhook_runner = None
+        if len(webhook_app.router.routes()):
             try:
-                webhook_runner = await plex_webhook.start_webhook_server(
-                    bot=application.bot,
-                    admin_ids=settings.admin_user_ids,
-                    port=getattr(settings, "plex_webhook_port", 32401),
-                    events=getattr(settings, "plex_webhook_events", None),
+                webhook_runner = await telegram_webhook.start_server(
+                    webhook_app, port=getattr(settings, "plex_webhook_port", 32401)
                 )
             except Exception as e:
-                logger.error(f"Failed to start Plex webhook server: {e}")
+                logger.error(f"Failed to start webhook server: {e}")
+                if use_webhook:
+                    logger.error("Falling back to polling for Telegram updates")
+                    use_webhook = False
+
+        if use_webhook:
+            await telegram_webhook.set_webhook(application, telegram_webhook_url, secret_token)
+        else:
+            # Polling also removes any webhook left over from a previous run
+            await application.updater.start_polling()
 
         # Check container status periodically
         if settings.docker_container_management_enabled:
@@ -2768,21 +2844,36 @@ class Searcharr(object):
                 if webhook_runner:
                     await webhook_runner.cleanup()
                 await application.stop()
+                await self._close_arr_clients()
+                await self._stop_background_tasks()
+                await self._save_rate_limits()
+                self._db.close()
         else:
             # If Docker container management is disabled, just idle
             await application.updater.idle()
 
-    def _create_conversation(self, id, username, kind, results):
-        con, cur = self._get_con_cur()
-        q = "INSERT OR REPLACE INTO conversations (id, username, type, results) VALUES (?, ?, ?, ?)"
-        qa = (id, username, kind, json.dumps(results))
-        logger.debug(f"Executing query: [{q}] with args: [{qa}]")
+    async def _create_conversation(self, id, username, kind, results):
+        results = conversations.trim_results(kind, results)
+        created_at = time.time()
+        self._convo_writes += 1
+        q = "INSERT OR REPLACE INTO conversations (id, username, type, results, created_at) VALUES (?, ?, ?, ?, ?)"
+        qa = (id, username, kind, conversations.encode(results), created_at)
+        logger.debug(
+            f"Executing query: [{q}] with args: [{qa[:3]}] and {len(qa[3])} bytes of results"
+        )
         try:
-            with DBLOCK:
-                cur.execute(q, qa)
-                con.commit()
-                con.close()
-                return True
+            await self._db.execute(q, qa)
+            self._convo_cache.put(
+                id,
+                {
+                    "id": id,
+                    "username": username,
+                    "type": kind,
+                    "results": results,
+                    "created_at": created_at,
+                },
+            )
+            return True
         except sqlite3.Error as e:
             logger.error(
                 f"Error executing database query to create conversation [{q}]: {e}"
@@ -2790,167 +2881,171 @@ class Searcharr(object):
             raise
 
     def _generate_cid(self):
-        q = "SELECT * FROM conversations WHERE id=?"
-        con, cur = self._get_con_cur()
-        while True:
-            u = uuid.uuid4().hex[:8]
-            try:
-                r = cur.execute(q, (u,))
-            except sqlite3.Error as e:
-                r = None
-                logger.error(
-                    f"Error executing database query to check conversation id uniqueness [{q}]: {e}"
-                )
+        return self._cid_generator.next()
 
-            if not r:
+    def _conversation_expired(self, record):
+        # Expired conversations stay stored until the next sweep, but no
+        # longer count as found
+        ttl = getattr(settings, "searcharr_conversation_ttl", 86400)
+        if not ttl or (record.get("created_at") or 0) >= time.time() - ttl:
+            return False
+        logger.debug(f"Conversation {record['id']} has expired")
+        self._convo_cache.pop(record["id"])
+        self._add_data_cache.pop(record["id"])
+        return True
+
+    async def _get_conversation(self, id):
+        if record := self._convo_cache.get(id):
+            if self._conversation_expired(record):
                 return None
-            elif not len(r.fetchall()):
-                con.close()
-                return u
-            else:
-                logger.warning("Detected conversation id collision. Interesting.")
+            logger.debug(
+                f"Found conversation {id} in memory ({self._convo_cache.stats()})"
+            )
+            return dict(record)
 
-    def _get_conversation(self, id):
+        writes = self._convo_writes
         q = "SELECT * FROM conversations WHERE id=?;"
         qa = (id,)
         logger.debug(f"Executing query: [{q}] with args: [{qa}]...")
         try:
-            con, cur = self._get_con_cur()
-            r = cur.execute(q, qa)
+            record = await self._db.fetchone(q, qa)
         except sqlite3.Error as e:
-            r = None
             logger.error(
                 f"Error executing database query to look up conversation from the database [{q}]: {e}"
             )
+            return None
 
-        if r:
-            record = r.fetchone()
-            if record:
-                logger.debug(f"Found conversation {record['id']} in the database")
-                record.update({"results": json.loads(record["results"])})
-            con.close()
-            return record
+        if record and not self._conversation_expired(record):
+            logger.debug(f"Found conversation {record['id']} in the database")
+            record.update({"results": conversations.decode(record["results"])})
+            if writes == self._convo_writes:
+                # Only cache what was read if nothing was written meanwhile
+                self._convo_cache.put(id, record)
+            return dict(record)
 
         logger.debug(f"Found no conversation for id [{id}]")
         return None
 
-    def _delete_conversation(self, id):
-        self._clear_add_data(id)
+    async def _delete_conversation(self, id):
+        await self._clear_add_data(id)
+        self._convo_writes += 1
+        self._convo_cache.pop(id)
         q = "DELETE FROM conversations WHERE id=?;"
         qa = (id,)
         logger.debug(f"Executing query: [{q}] with args: [{qa}]")
         try:
-            con, cur = self._get_con_cur()
-            with DBLOCK:
-                cur.execute(q, qa)
-                con.commit()
-                con.close()
-                return True
+            await self._db.execute(q, qa)
+            return True
         except sqlite3.Error as e:
             logger.error(
                 f"Error executing database query to delete conversation from the database [{q}]: {e}"
             )
             return False
 
-    def _get_add_data(self, cid):
+    async def _get_add_data(self, cid):
+        if (add_data := self._add_data_cache.get(cid)) is not None:
+            return conversations.AddData(add_data)
+
+        writes = self._convo_writes
         q = "SELECT * FROM add_data WHERE cid=?;"
         qa = (cid,)
         logger.debug(f"Executing query: [{q}] with args: [{qa}]...")
         try:
-            con, cur = self._get_con_cur()
-            r = cur.execute(q, qa)
+            records = await self._db.fetchall(q, qa)
         except sqlite3.Error as e:
-            r = None
             logger.error(
                 f"Error executing database query to look up conversation add data from the database [{q}]: {e}"
             )
-
-        if r:
-            records = r.fetchall()
-            con.close()
-            logger.debug(f"Query response: {records}")
-            return {x["key"]: x["value"] for x in records}
-        else:
-            return {}
-
-    def _update_add_data(self, cid, key, value):
-        con, cur = self._get_con_cur()
-        q = "INSERT OR REPLACE INTO add_data (cid, key, value) VALUES (?, ?, ?)"
-        qa = (cid, key, str(value))
-        logger.debug(f"Executing query: [{q}] with args: [{qa}]")
+            return conversations.AddData()
+
+        logger.debug(f"Query response: {records}")
+        add_data = {x["key"]: x["value"] for x in records}
+        if writes == self._convo_writes:
+            self._add_data_cache.put(cid, add_data)
+        return conversations.AddData(add_data)
+
+    async def _save_add_data(self, cid, add_data):
+        # Write every key changed since add_data was loaded in one transaction
+        rows = [(cid, k, add_data[k]) for k in add_data.changed]
+        if not rows:
+            return True
+
+        def save(con, cur):
+            # Skip it if the conversation was deleted while handling the button
+            if not cur.execute(
+                "SELECT 1 FROM conversations WHERE id=?;", (cid,)
+            ).fetchone():
+                return False
+            cur.executemany(
+                "INSERT OR REPLACE INTO add_data (cid, key, value) VALUES (?, ?, ?)",
+                rows,
+            )
+            return True
+
+        logger.debug(f"Saving add data for cid=[{cid}]: {rows}")
+        self._convo_writes += 1
         try:
-            with DBLOCK:
-                cur.execute(q, qa)
-                con.commit()
-                con.close()
-                return True
+            saved = await self._db.write(save)
         except sqlite3.Error as e:
-            logger.error(f"Error executing database query [{q}]: {e}")
+            logger.error(f"Error saving add data for cid=[{cid}]: {e}")
             raise
-
-    def _clear_add_data(self, cid):
+        if saved:
+            add_data.changed.clear()
+            self._add_data_cache.put(cid, dict(add_data))
+        return saved
+
+    async def _clear_add_data(self, cid):
+        self._convo_writes += 1
+        self._add_data_cache.pop(cid)
         q = "DELETE FROM add_data WHERE cid=?;"
         qa = (cid,)
         logger.debug(f"Executing query: [{q}] with args: [{qa}]")
         try:
-            con, cur = self._get_con_cur()
-            with DBLOCK:
-                cur.execute(q, qa)
-                con.commit()
-                con.close()
-                return True
+            await self._db.execute(q, qa)
+            return True
         except sqlite3.Error as e:
             logger.error(
                 f"Error executing database query to delete conversation add data from the database [{q}]: {e}"
             )
             return False
 
-    def _add_user(self, id, username, admin=""):
-        con, cur = self._get_con_cur()
+    async def _add_user(self, id, username, admin=""):
         q = "INSERT OR REPLACE INTO users (id, username, admin) VALUES (?, ?, ?);"
         qa = (id, username, admin)
         logger.debug(f"Executing query: [{q}] with args: [{qa}]")
         try:
-            with DBLOCK:
-                cur.execute(q, qa)
-                con.commit()
-                con.close()
-                return True
+            await self._db.execute(q, qa)
+            self._auth_cache[id] = 2 if admin else 1
+            return True
         except sqlite3.Error as e:
             logger.error(f"Error executing database query [{q}]: {e}")
             raise
 
-    def _remove_user(self, id):
-        con, cur = self._get_con_cur()
+    async def _remove_user(self, id):
         q = "DELETE FROM users where id=?;"
         qa = (id,)
         logger.debug(f"Executing query: [{q}] with args: [{qa}]")
         try:
-            with DBLOCK:
-                cur.execute(q, qa)
-                con.commit()
-                con.close()
-                return True
+            await self._db.execute(q, qa)
+            self._auth_cache.pop(id, None)
+            return True
         except sqlite3.Error as e:
             logger.error(f"Error executing database query [{q}]: {e}")
             raise
 
-    def _get_users(self, admin=False):
+    async def _get_users(self, admin=False):
         adminQ = " where IFNULL(admin, '') != ''" if admin else ""
         q = f"SELECT * FROM users{adminQ};"
         logger.debug(f"Executing query: [{q}] with no args...")
         try:
-            con, cur = self._get_con_cur()
-            r = cur.execute(q)
+            records = await self._db.fetchall(q)
         except sqlite3.Error as e:
-            r = None
+            records = None
             logger.error(
                 f"Error executing database query to look up users from the database [{q}]: {e}"
             )
 
-        if r:
-            records = r.fetchall()
-            con.close()
+        if records:
             return records
 
         logger.debug(
@@ -2958,58 +3053,130 @@ class Searcharr(object):
         )
         return []
 
-    def _update_admin_access(self, user_id, admin=""):
-        con, cur = self._get_con_cur()
+    async def _update_admin_access(self, user_id, admin=""):
         q = "UPDATE users set admin=? where id=?;"
         qa = (str(admin), user_id)
         logger.debug(f"Executing query: [{q}] with args: [{qa}]")
         try:
-            with DBLOCK:
-                cur.execute(q, qa)
-                con.commit()
-                con.close()
-                return True
+            await self._db.execute(q, qa)
+            if user_id in self._auth_cache:
+                self._auth_cache[user_id] = 2 if str(admin) else 1
+            return True
         except sqlite3.Error as e:
             logger.error(f"Error executing database query [{q}]: {e}")
             raise
 
-    def _authenticated(self, user_id):
-        # Return True if user is authenticated
+    async def _authenticated(self, user_id):
+        # Return 2 if user is an admin, 1 if user is authenticated
         # Else return False
-        q = "SELECT * FROM users WHERE id=?;"
-        qa = (user_id,)
-        logger.debug(f"Executing query: [{q}] with args: [{qa}]...")
+        ttl = getattr(settings, "searcharr_auth_cache_ttl", 0)
+        if self._auth_cache_loaded is None or (
+            ttl and time.monotonic() - self._auth_cache_loaded > ttl
+        ):
+            await self._load_auth_cache()
+
+        if auth_level := self._auth_cache.get(user_id):
+            return auth_level
+
+        logger.debug(f"Did not find user [{user_id}] in the database.")
+        return False
+
+    async def _render_result(self, message, kind, r, cid, i, total, **kwargs):
+        # Show result r on an existing message: poster, caption and keyboard in one edit
+        reply_message, reply_markup = self._prepare_response(
+            kind, r, cid, i, total, **kwargs
+        )
+        await self._send_with_poster(
+            r["remotePoster"],
+            lambda photo: message.edit_media(
+                media=InputMediaPhoto(photo, caption=reply_message),
+                reply_markup=reply_markup,
+            ),
+        )
+
+    async def _send_with_poster(self, url, send):
+        # Call send(photo) with the poster at url, using the Telegram file_id
+        # from an earlier upload when there is one. Falls back to the default
+        # poster if Telegram can't use it, and remembers the file_id returned.
+        for poster in dict.fromkeys([url, DEFAULT_POSTER]):
+            file_id = self._poster_cache.get(poster)
+            for photo in [file_id, poster] if file_id else [poster]:
+                try:
+                    message = await send(photo)
+                except BadRequest as e:
+                    if (
+                        str(e) not in self._bad_request_poster_error_messages
+                        or photo == DEFAULT_POSTER
+                    ):
+                        raise
+                    if photo == file_id:
+                        logger.warning(
+                            f"Cached file_id for poster [{poster}] was rejected: BadRequest: {e}. Sending from the URL instead..."
+                        )
+                        self._poster_cache.pop(poster)
+                    else:
+                        logger.error(
+                            f"Error sending photo [{poster}]: BadRequest: {e}. Attempting to send with default poster..."
+                        )
+                    continue
+                await self._remember_poster(poster, message)
+                return message
+
+    async def _remember_poster(self, url, message):
+        # edit_media returns True rather than a message for inline messages
+        if not self._poster_cache.maxsize or not getattr(message, "photo", None):
+            return
+        file_id = message.photo[-1].file_id
+        if self._poster_cache.peek(url) == file_id:
+            return
+        self._poster_cache.put(url, file_id)
+        q = "INSERT OR REPLACE INTO poster_cache (url, file_id, updated_at) VALUES (?, ?, ?);"
+        qa = (url, file_id, time.time())
+        logger.debug(f"Executing query: [{q}] with args: [{qa}]")
         try:
-            con, cur = self._get_con_cur()
-            r = cur.execute(q, qa)
+            await self._db.execute(q, qa)
         except sqlite3.Error as e:
-            r = None
-            logger.error(
-                f"Error executing database query to look up user from the database [{q}]: {e}"
+            logger.error(f"Error saving poster file_id to the database [{q}]: {e}")
+
+    async def _load_poster_cache(self):
+        # Load the most recently uploaded posters, up to the size of the cache,
+        # and forget older ones
+        size = self._poster_cache.maxsize
+        q = "SELECT url, file_id FROM poster_cache ORDER BY updated_at DESC LIMIT ?;"
+        logger.debug(f"Executing query: [{q}] with args: [{(size,)}]...")
+        try:
+            records = await self._db.fetchall(q, (size,))
+            await self._db.execute(
+                "DELETE FROM poster_cache WHERE url NOT IN (SELECT url FROM poster_cache ORDER BY updated_at DESC LIMIT ?);",
+                (size,),
             )
-            return False
+        except sqlite3.Error as e:
+            logger.error(f"Error loading poster file_ids from the database [{q}]: {e}")
+            return
 
-        if r:
-            record = r.fetchone()
-            logger.debug(f"Query result for user lookup: {record}")
-            con.close()
-            if record and record["id"] == user_id:
-                return 2 if record["admin"] else 1
+        for x in reversed(records):
+            self._poster_cache.put(x["url"], x["file_id"])
+        logger.debug(f"Loaded {len(records)} poster file_ids into the poster cache")
 
-        logger.debug(f"Did not find user [{user_id}] in the database.")
-        return False
+    async def _load_auth_cache(self):
+        # Keep every user's access level in memory; _add_user, _remove_user and
+        # _update_admin_access write through to it
+        q = "SELECT id, admin FROM users;"
+        logger.debug(f"Executing query: [{q}] with no args...")
+        try:
+            records = await self._db.fetchall(q)
+        except sqlite3.Error as e:
+            logger.error(
+                f"Error executing database query to load users from the database [{q}]: {e}"
+            )
+            return
+
+        self._auth_cache = {x["id"]: 2 if x["admin"] else 1 for x in records}
+        self._auth_cache_loaded = time.monotonic()
+        logger.debug(f"Loaded {len(self._auth_cache)} users into the auth cache")
 
-    def _dict_factory(self, cursor, row):
-        """From sqlite3 documentation:
-        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection.row_factory
-        """
-        d = {}
-        for idx, col in enumerate(cursor.description):
-            d[col[0]] = row[idx]
-        return d
-
-    def _get_con_cur(self):
-        # Connect to local DB and return tuple containing connection and cursor
+    def _open_db(self):
+        # Create the data directory if needed and open the database
         if not os.path.isdir(DBPATH):
             try:
                 logger.debug(
@@ -3020,69 +3187,58 @@ class Searcharr(object):
                 logger.error(f"Error creating data directory: {e}.")
                 raise
 
+        self._db = db.Database(
+            os.path.join(DBPATH, DBFILE),
+            logger,
+            pool_size=getattr(settings, "searcharr_db_pool_size", db.DEFAULT_POOL_SIZE),
+            batch_size=getattr(
+                settings, "searcharr_db_write_batch_size", db.DEFAULT_BATCH_SIZE
+            ),
+        )
+
+    async def _init_db(self):
+        self._open_db()
         try:
-            con = sqlite3.connect(os.path.join(DBPATH, DBFILE), timeout=30)
-            con.execute("PRAGMA journal_mode = WAL;")
-            con.row_factory = self._dict_factory
-            cur = con.cursor()
-            logger.debug(
-                f"Database connection established [{os.path.join(DBPATH, DBFILE)}]."
-            )
+            await migrations.migrate(self._db, logger)
         except sqlite3.Error as e:
-            logger.error(f"Error connecting to database: {e}")
+            logger.error(f"Error migrating the database: {e}")
             raise
 
-        return (con, cur)
-
-    def _init_db(self):
-        con, cur = self._get_con_cur()
-        queries = [
-            """CREATE TABLE IF NOT EXISTS conversations (
-                id text primary key,
-                username text not null,
-                type text,
-                results text
-            );""",
-            """CREATE TABLE IF NOT EXISTS users (
-                id integer primary key,
-                username text not null,
-                admin text,
-                permissions text
-            );""",
-            """CREATE TABLE IF NOT EXISTS add_data (
-                cid text,
-                key text,
-                value text,
-                primary key (cid, key)
-            );""",
-            """CREATE TABLE IF NOT EXISTS request_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                username TEXT,
-                request_type TEXT NOT NULL,
-                title TEXT NOT NULL,
-                tmdb_id TEXT,
-                tvdb_id TEXT,
-                status TEXT DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );""",
-            """CREATE TABLE IF NOT EXISTS rate_limits (
-                user_id INTEGER PRIMARY KEY,
-                request_count INTEGER DEFAULT 0,
-                window_start TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );""",
-        ]
-        for q in queries:
-            logger.debug(f"Executing query: [{q}] with no args...")
-            try:
-                with DBLOCK:
-                    cur.execute(q)
-            except sqlite3.Error as e:
-                logger.error(f"Error executing database query [{q}]: {e}")
-                raise
+        # Seed conversation ids past the newest one already stored
+        q = "SELECT MAX(id) AS id FROM conversations WHERE length(id)=?;"
+        record = await self._db.fetchone(q, (conversations.CID_LENGTH,))
+        self._cid_generator = conversations.CidGenerator(record["id"])
 
-        con.commit()
-        con.close()
+    async def _sweep_conversations(self):
+        # Delete conversations older than searcharr_conversation_ttl (if set),
+        # along with their add data and any add data left without a conversation
+        ttl = getattr(settings, "searcharr_conversation_ttl", 86400)
+        cutoff = time.time() - ttl
+
+        def sweep(con, cur):
+            deleted = 0
+            if ttl:
+                cur.execute("DELETE FROM conversations WHERE created_at < ?;", (cutoff,))
+                deleted = cur.rowcount
+            cur.execute(
+                "DELETE FROM add_data WHERE cid NOT IN (SELECT id FROM conversations);"
+            )
+            return deleted
+
+        try:
+            deleted = await self._db.write(sweep)
+        except sqlite3.Error as e:
+            logger.error(f"Error deleting expired conversations: {e}")
+            return
+        if deleted:
+            logger.debug(f"Deleted {deleted} expired conversations")
+            for cid in self._convo_cache.keys():
+                if (self._convo_cache.peek(cid).get("created_at") or 0) < cutoff:
+                    self._convo_cache.pop(cid)
+                    self._add_data_cache.pop(cid)
+        logger.debug(
+            f"Conversation cache: {self._convo_cache.stats()}; add data cache: {self._add_data_cache.stats()}"
+        )
 
     def _load_language(self, lang_ietf=None):
         if not lang_ietf:
@@ -3125,5 +3281,8 @@ class Searcharr(object):
 if __name__ == "__main__":
     args = parse_args()
     logger = set_up_logger("searcharr", args.verbose, args.console_logging)
-    tgr = Searcharr(settings.tgram_token)
-    asyncio.run(tgr.run())
+    if args.migrate_dry_run:
+        asyncio.run(migrations.dry_run(os.path.join(DBPATH, DBFILE), logger))
+    else:
+        tgr = Searcharr(settings.tgram_token)
+        asyncio.run(tgr.run())
@@ -13,9 +13,29 @@ searcharr_language = "en-us"  # Language for bot messages (see lang/ directory f
 searcharr_start_command_aliases = ["start"]  # Command aliases for the start command
 searcharr_help_command_aliases = ["help"]  # Command aliases for the help command
 searcharr_users_command_aliases = ["users"]  # Command aliases for the users command
+searcharr_http_pool_size = 10  # Keep-alive connections pooled per Sonarr/Radarr/Readarr instance
+searcharr_http_timeout = (5, 30)  # (connect, read) timeout in seconds for Sonarr/Radarr/Readarr API calls
+searcharr_http_keep_alive = True  # Reuse connections between API calls (set False if a proxy drops idle connections)
+searcharr_http_max_retries = 2  # Retries for GET requests that fail to connect
+searcharr_lookup_cache_size = 256  # Search results cached per Sonarr/Radarr/Readarr instance (0 to disable)
+searcharr_lookup_cache_ttl = 600  # Seconds to reuse cached search results before searching again
+searcharr_db_pool_size = 4  # Long-lived SQLite connections kept open for the bot database
+searcharr_db_write_batch_size = 64  # Most queued database writes committed together in one transaction
+searcharr_db_maintenance_hour = 4  # Hour of the day (0-23, local time) to vacuum, optimize and checkpoint the database (None to disable)
+searcharr_auth_cache_ttl = 0  # Seconds before user access is re-read from the database (0 = only at startup)
+searcharr_conversation_ttl = 86400  # Seconds before an unfinished search is forgotten and its buttons stop working (0 = never)
+searcharr_conversation_sweep_interval = 3600  # Seconds between deleting expired searches from the database (0 to disable)
+searcharr_conversation_cache_size = 128  # Recent searches kept decoded in memory
+searcharr_poster_cache_size = 2048  # Posters remembered as Telegram file_ids so they are only uploaded once
+searcharr_concurrent_updates = 8  # Messages and button presses handled at once; each user's, and each search's, are still handled in order (1 = one at a time)
+searcharr_request_history_retention_days = 365  # Days of /myrequests history kept; daily totals are kept regardless (0 = keep forever)
 
 # Telegram Bot
 tgram_token = "YOUR_TELEGRAM_BOT_TOKEN"  # Get from BotFather
+telegram_webhook_enabled = False  # Receive updates by webhook instead of polling (served on plex_webhook_port)
+telegram_webhook_url = ""  # Public HTTPS URL Telegram posts updates to, e.g. "https://bot.example.com/telegram" (must reach telegram_webhook_path)
+telegram_webhook_path = "/telegram"  # Local path the webhook server accepts Telegram updates on
+telegram_webhook_secret = ""  # Secret Telegram sends with each update (A-Z, a-z, 0-9, _ and -; empty = random each start)
 
 # Sonarr
 sonarr_enabled = True  # Set to False to disable Sonarr functionality
@@ -29,6 +49,7 @@ sonarr_forced_tags = []  # Tags to add to all series
 sonarr_allow_user_to_select_tags = False  # Allow users to select tags when adding series
 sonarr_user_selectable_tags = []  # Tags users can select (empty list = all tags)
 sonarr_series_command_aliases = ["series", "tv"]  # Command aliases for the series command
+sonarr_library_cache_ttl = 300  # Seconds before the cached Sonarr library is refreshed in the background
 
 # Radarr
 radarr_enabled = True  # Set to False to disable Radarr functionality
@@ -42,6 +63,7 @@ radarr_forced_tags = []  # Tags to add to all movies
 radarr_allow_user_to_select_tags = True  # Allow users to select tags when adding movies
 radarr_user_selectable_tags = []  # Tags users can select (empty list = all tags)
 radarr_movie_command_aliases = ["movie", "mv"]  # Command aliases for the movie command
+radarr_library_cache_ttl = 300  # Seconds before the cached Radarr library is refreshed in the background
 
 # Readarr
 readarr_enabled = True  # Set to False to disable Readarr functionality
@@ -55,6 +77,7 @@ readarr_forced_tags = []  # Tags to add to all books
 readarr_allow_user_to_select_tags = True  # Allow users to select tags when adding books
 readarr_user_selectable_tags = []  # Tags users can select (empty list = all tags)
 readarr_book_command_aliases = ["book", "bk"]  # Command aliases for the book command
+readarr_library_cache_ttl = 300  # Seconds before the cached Readarr library is refreshed in the background
 
 # Transmission
 localhost = "localhost"  # Transmission host
@@ -68,4 +91,18 @@ docker_container_restart_command = "cd ~/Docker/protonvpn && docker compose up -
 docker_status_check_interval = 300  # Check container status every 5 minutes (in seconds)
 docker_restart_command_aliases = ["restart_vpn"]  # Command aliases for the restart command
 restart = ["restart"]  # Legacy setting for restart command aliases
-admin_user_ids = [123456789]  # Telegram user IDs of admins to notify when container is down
\ No newline at end of file
+admin_user_ids = [123456789]  # Telegram user IDs of admins to notify when container is down
+
+# Rate Limiting
+rate_limit_requests = 20  # Searches a user can make in a burst before being limited
+rate_limit_window = 60  # Seconds for a user's full allowance to refill (must be more than 0)
+rate_limit_command_costs = {}  # Per-command cost in requests, e.g. {"series": 2} (default cost is 1)
+rate_limit_snapshot_interval = 60  # Seconds between saving rate limits to the database (0 to disable)
+rate_limit_send_overall = 30  # Messages per second the bot sends to Telegram across all chats
+rate_limit_send_per_chat = 1  # Messages per second the bot sends to one private chat (short bursts allowed)
+rate_limit_send_per_group = 20  # Messages per minute the bot sends to one group
+
+# Plex Webhook (requires Plex Pass; register http://<server-ip>:<plex_webhook_port>/plex in Plex > Settings > Webhooks)
+plex_webhook_enabled = False  # Send Telegram notifications for Plex events
+plex_webhook_port = 32401  # Port of the webhook server, shared by the Plex and Telegram webhooks
+plex_webhook_events = {"media.play", "media.resume", "media.scrobble"}  # Plex events that trigger a notification
@@ -6,16 +6,43 @@ By Todd Roberts
 https://github.com/toddrob99/searcharr
 """
 import requests
-import time
 from urllib.parse import quote
 
 from log import set_up_logger
+import cache
+import http_helper
 
 
 class Sonarr(object):
-    def __init__(self, api_url, api_key, verbose=False):
+    """Sonarr API wrapper whose per-request methods are coroutines.
+
+    Version discovery, quality profiles, root folders and the first library
+    fetch are loaded synchronously by the constructor (before the bot starts
+    handling updates); everything a handler calls afterwards goes through an
+    httpx.AsyncClient so the event loop is never blocked on Sonarr.
+    """
+
+    def __init__(
+        self,
+        api_url,
+        api_key,
+        verbose=False,
+        pool_size=http_helper.DEFAULT_POOL_SIZE,
+        timeout=http_helper.DEFAULT_TIMEOUT,
+        keep_alive=True,
+        max_retries=http_helper.DEFAULT_MAX_RETRIES,
+        library_ttl=300,
+        lookup_cache_size=256,
+        lookup_cache_ttl=600,
+    ):
         self.logger = set_up_logger("searcharr.sonarr", verbose, False)
         self.logger.debug("Logging started!")
+        self._timeout = http_helper.normalize_timeout(timeout)
+        self._session = http_helper.build_session(pool_size, max_retries, keep_alive)
+        self._inflight = http_helper.SingleFlight()
+        self._lookup_cache = cache.LookupCache(
+            "Sonarr", lookup_cache_size, lookup_cache_ttl, self.logger
+        )
         if api_url[-1] == "/":
             api_url = api_url[:-1]
         if api_url[:4] != "http":
@@ -27,8 +54,17 @@ class Sonarr(object):
             self.api_url = api_url + "/api/{endpoint}?apikey=" + api_key
         self._quality_profiles = self.get_all_quality_profiles()
         self._root_folders = self.get_root_folders()
-        self._all_series = {}
-        self.get_all_series()
+        self._series_index = cache.LibraryIndex(
+            "series", "tvdbId", library_ttl, self.logger
+        )
+        self._series_index.refresh(self._fetch_all_series)
+        self._client = http_helper.build_async_client(
+            pool_size, timeout, keep_alive, max_retries
+        )
+
+    async def aclose(self):
+        await self._client.aclose()
+        self._session.close()
 
     def discover_version(self, api_url, api_key):
         try:
@@ -54,10 +90,19 @@ class Sonarr(object):
         self.logger.debug("Failed to discover Sonarr version")
         return None
 
-    def lookup_series(self, title=None, tvdb_id=None):
-        r = self._api_get(
-            "series/lookup", {"term": f"tvdb:{tvdb_id}" if tvdb_id else quote(title)}
-        )
+    async def lookup_series(self, title=None, tvdb_id=None):
+        term = f"tvdb:{tvdb_id}" if tvdb_id else title
+        r = self._lookup_cache.get(term)
+        if r is None:
+            r = await self._async_api_get(
+                "series/lookup",
+                {"term": f"tvdb:{tvdb_id}" if tvdb_id else quote(title)},
+            )
+            self._lookup_cache.put(term, r)
+        await self._series_index.aensure(self._async_fetch_all_series)
+        return self._format_lookup_results(r)
+
+    def _format_lookup_results(self, r):
         if not r:
             return []
 
@@ -89,20 +134,19 @@ class Sonarr(object):
         ]
 
     def _series_internal_id(self, tvdb_id):
-        return next(
-            (x["id"] for x in self.get_all_series() if x.get("tvdbId", 0) == tvdb_id),
-            None,
-        )
+        return self._series_index.internal_id(tvdb_id)
 
-    def get_all_series(self):
-        if int(round(self._all_series.get("ts", 0))) < int(round(time.time())) - 30:
-            self.logger.debug("Refreshing all series cache...")
-            r = self._api_get("series", {})
-            self._all_series.update({"series": r, "ts": time.time()})
+    async def get_all_series(self):
+        index = await self._series_index.aensure(self._async_fetch_all_series)
+        return index.values()
 
-        return self._all_series["series"]
+    def _fetch_all_series(self):
+        return self._api_get("series", {}) or []
 
-    def add_series(
+    async def _async_fetch_all_series(self):
+        return await self._async_api_get("series", {}) or []
+
+    async def add_series(
         self,
         series_info=None,
         tvdb_id=None,
@@ -116,17 +160,43 @@ class Sonarr(object):
             return False
 
         if not series_info:
-            series_info = self.lookup_series(tvdb_id=tvdb_id)
+            series_info = await self.lookup_series(tvdb_id=tvdb_id)
             if len(series_info):
                 series_info = series_info[0]
             else:
                 return False
 
+        params = self._add_series_params(
+            series_info,
+            search,
+            season_folders,
+            monitored,
+            unmonitor_existing,
+            additional_data,
+        )
+        r = await self._async_api_post("series", params)
+        self._series_index.add(r)
+        self._lookup_cache.clear()
+        return r
+
+    def _add_series_params(
+        self,
+        series_info,
+        search,
+        season_folders,
+        monitored,
+        unmonitor_existing,
+        additional_data,
+    ):
         self.logger.debug(f"Additional data: {additional_data}")
 
         path = additional_data["p"]
         quality = int(additional_data["q"])
         monitor_options = int(additional_data.get("m", 0))
+        # Adjust monitoring on copies; series_info may be shared with a cache
+        series_info = dict(
+            series_info, seasons=[dict(s) for s in series_info["seasons"]]
+        )
         if monitor_options == 1:
             # Monitor only the first season
             for s in series_info["seasons"]:
@@ -172,7 +242,7 @@ class Sonarr(object):
             },
         }
 
-        return self._api_post("series", params)
+        return params
 
     def get_root_folders(self):
         r = self._api_get("RootFolder", {})
@@ -189,13 +259,17 @@ class Sonarr(object):
             for x in r
         ]
 
-    def get_all_tags(self):
-        r = self._api_get("tag", {})
+    async def get_all_tags(self):
+        r = await self._async_api_get("tag", {})
         self.logger.debug(f"Result of API call to get all tags: {r}")
         return [] if not r else r
 
-    def get_filtered_tags(self, allowed_tags, excluded_tags):
-        r = self.get_all_tags()
+    async def get_filtered_tags(self, allowed_tags, excluded_tags):
+        return self._filter_tags(
+            await self.get_all_tags(), allowed_tags, excluded_tags
+        )
+
+    def _filter_tags(self, r, allowed_tags, excluded_tags):
         if not r:
             return []
         elif allowed_tags == []:
@@ -214,42 +288,62 @@ class Sonarr(object):
                 and x["label"] not in excluded_tags
             ]
 
-    def add_tag(self, tag):
+    async def add_tag(self, tag):
         params = {
             "label": tag,
         }
-        t = self._api_post("tag", params)
+        t = await self._async_api_post("tag", params)
         self.logger.debug(f"Result of API call to add tag: {t}")
         return t
 
-    def get_tag_id(self, tag):
-        if i := next(
+    async def get_tag_id(self, tag):
+        if i := self._find_tag_id(await self.get_all_tags(), tag):
+            self.logger.debug(f"Found tag id [{i}] for tag [{tag}]")
+            return i
+        else:
+            self.logger.debug(f"No tag id found for [{tag}]; adding...")
+            return self._added_tag_id(tag, await self.add_tag(tag))
+
+    async def get_tag_ids(self, tags):
+        # Resolve several tags (adding any that are missing) with one tag fetch
+        all_tags = list(await self.get_all_tags())
+        tag_ids = {}
+        for tag in tags:
+            if i := self._find_tag_id(all_tags, tag):
+                self.logger.debug(f"Found tag id [{i}] for tag [{tag}]")
+            else:
+                self.logger.debug(f"No tag id found for [{tag}]; adding...")
+                t = await self.add_tag(tag)
+                if i := self._added_tag_id(tag, t):
+                    all_tags.append(t)
+            tag_ids[tag] = i
+        return tag_ids
+
+    def _find_tag_id(self, all_tags, tag):
+        return next(
             iter(
                 [
                     x.get("id")
-                    for x in self.get_all_tags()
+                    for x in all_tags
                     if x.get("label").lower() == tag.lower()
                 ]
             ),
             None,
-        ):
-            self.logger.debug(f"Found tag id [{i}] for tag [{tag}]")
-            return i
+        )
+
+    def _added_tag_id(self, tag, t):
+        if not isinstance(t, dict):
+            self.logger.error(
+                f"Wrong data type returned from Sonarr API when attempting to add tag [{tag}]. Expected dict, got {type(t)}."
+            )
+            return None
         else:
-            self.logger.debug(f"No tag id found for [{tag}]; adding...")
-            t = self.add_tag(tag)
-            if not isinstance(t, dict):
-                self.logger.error(
-                    f"Wrong data type returned from Sonarr API when attempting to add tag [{tag}]. Expected dict, got {type(t)}."
-                )
-                return None
-            else:
-                self.logger.debug(
-                    f"Created tag id for tag [{tag}]: {t['id']}"
-                    if t.get("id")
-                    else f"Could not add tag [{tag}]"
-                )
-            return t.get("id", None)
+            self.logger.debug(
+                f"Created tag id for tag [{tag}]: {t['id']}"
+                if t.get("id")
+                else f"Could not add tag [{tag}]"
+            )
+        return t.get("id", None)
 
     def lookup_quality_profile(self, v):
         # Look up quality profile from a profile name or id
@@ -269,38 +363,47 @@ class Sonarr(object):
         )
 
     def _api_get(self, endpoint, params={}):
+        # Blocking GET, only used while the constructor loads the basics.
+        # Concurrent callers asking for the same URL share one request
+        url = self._build_url(endpoint, params)
+        return self._inflight.do(url, self._submit_get, url)
+
+    def _submit_get(self, url):
+        self.logger.debug(f"Submitting GET request: [{url}]")
+        r = self._session.get(url, timeout=self._timeout)
+        return http_helper.parse_response(r)
+
+    def _build_url(self, endpoint, params={}):
         url = self.api_url.format(endpoint=endpoint)
         for k, v in params.items():
             url += f"&{k}={v}"
-        self.logger.debug(f"Submitting GET request: [{url}]")
-        r = requests.get(url)
-        if r.status_code not in [200, 201, 202, 204]:
-            r.raise_for_status()
-            return None
-        else:
-            return r.json()
+        return url
+
+    async def _async_api_get(self, endpoint, params={}):
+        url = self._build_url(endpoint, params)
+        return await self._inflight.ado(url, self._async_submit_get, url)
+
+    async def _async_submit_get(self, url):
+        self.logger.debug(f"Submitting async GET request: [{url}]")
+        r = await self._client.get(url)
+        return http_helper.parse_response(r)
 
-    def _api_post(self, endpoint, params={}):
+    async def _async_api_post(self, endpoint, params={}):
         url = self.api_url.format(endpoint=endpoint)
-        self.logger.debug(f"Submitting POST request: [{url}]; params: [{params}]")
-        r = requests.post(url, json=params)
-        if r.status_code not in [200, 201, 202, 204]:
-            r.raise_for_status()
-            return None
-        else:
-            return r.json()
-            
-    def search_series(self, series_id):
+        self.logger.debug(
+            f"Submitting async POST request: [{url}]; params: [{params}]"
+        )
+        r = await self._client.post(url, json=params)
+        return http_helper.parse_response(r)
+
+    async def search_series(self, series_id):
         """Trigger a search for an existing series by its ID."""
-        params = {
-            "name": "SeriesSearch",
-            "seriesIds": [series_id]
-        }
+        params = {"name": "SeriesSearch", "seriesIds": [series_id]}
         self.logger.debug(f"Triggering search for series ID: {series_id}")
-        return self._api_post("command", params)
+        return await self._async_api_post("command", params)
 
-    def scan_folder(self, path: str):
+    async def scan_folder(self, path: str):
         """Tell Sonarr to scan a folder for new episode files."""
         params = {"name": "DownloadedEpisodesScan", "path": path}
         self.logger.debug(f"Triggering Sonarr folder scan: {path}")
-        return self._api_post("command", params)
+        return await self._async_api_post("command", params)
@@ -0,0 +1,69 @@
+"""
+Searcharr
+Sonarr, Radarr & Readarr Telegram Bot
+Telegram Webhook
+https://github.com/toddrob99/searcharr
+"""
+import hmac
+import secrets
+
+from aiohttp import web
+from telegram import Update
+
+from log import set_up_logger
+
+logger = set_up_logger(__name__, False, False)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def new_secret():
+    # Telegram accepts 1-256 characters from A-Z, a-z, 0-9, _ and -
+    return secrets.token_urlsafe(32)
+
+
+async def _handle_update(request: web.Request, application, secret_token: str) -> web.Response:
+    # Telegram sends the secret given to set_webhook with every update;
+    # anything without it did not come from Telegram
+    token = request.headers.get(SECRET_HEADER, "")
+    if not hmac.compare_digest(token.encode("utf-8"), secret_token.encode("utf-8")):
+        logger.warning(f"Rejected Telegram webhook request from {request.remote}: bad secret token")
+        return web.Response(status=403, text="Forbidden")
+
+    try:
+        data = await request.json()
+        update = Update.de_json(data, application.bot)
+    except (ValueError, TypeError, KeyError) as e:
+        logger.error(f"Invalid Telegram webhook update: {e}")
+        return web.Response(status=400, text="Invalid update")
+
+    # Hand off to the application and answer straight away; Telegram waits
+    # for the response before sending the next update
+    await application.update_queue.put(update)
+    return web.Response(status=200, text="OK")
+
+
+def add_routes(app: web.Application, application, path: str, secret_token: str):
+    app.router.add_post(path, lambda r: _handle_update(r, application, secret_token))
+
+
+async def set_webhook(application, url: str, secret_token: str, drop_pending_updates: bool = False):
+    await application.bot.set_webhook(
+        url=url,
+        secret_token=secret_token,
+        allowed_updates=Update.ALL_TYPES,
+        drop_pending_updates=drop_pending_updates,
+    )
+    logger.info(f"Telegram webhook set to {url}")
+
+
+async def start_server(app: web.Application, port: int):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "0.0.0.0", port)
+    await site.start()
+    logger.info(
+        f"Webhook server listening on port {port}: "
+        + ", ".join(sorted({r.resource.canonical for r in app.router.routes()}))
+    )
+    return runner
@@ -1,6 +1,7 @@
 import telegram
 from telegram.ext import Application, CommandHandler
 import transmissionrpc
+import ratelimit
 import settings
 import re
 import shlex
@@ -187,7 +188,8 @@ class StatusFinder:
                     restart_cmd = getattr(settings, 'docker_restart_command_aliases', ['restart_vpn'])[0]
                     await bot.send_message(
                         chat_id=admin_id,
-                        text=f"⚠️ Container {container_name} is down! Use /{restart_cmd} to restart it."
+                        text=f"⚠️ Container {container_name} is down! Use /{restart_cmd} to restart it.",
+                        rate_limit_args={"priority": ratelimit.NOTIFICATION},
                     )
                 except Exception as e:
                     self.logger.error(f"Failed to send notification to admin {admin_id}: {e}")
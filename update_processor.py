@@ -0,0 +1,87 @@
+"""
+Searcharr
+Sonarr, Radarr & Readarr Telegram Bot
+Update Processor
+https://github.com/toddrob99/searcharr
+"""
+import asyncio
+from contextlib import AsyncExitStack
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# Updates accepted from the queue at once, including those waiting for an
+# earlier update from the same user or for the same search to finish
+MAX_PENDING_UPDATES = 256
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """Handle updates concurrently, but one at a time per user and per search.
+
+    Each update takes a lock for the user who sent it and, for button
+    presses, one for the conversation id in the callback data, so two presses
+    on the same search result never run together even when pressed by
+    different users in a group. Locks are always taken user first, so two
+    updates can never wait on each other. Only updates holding their locks
+    count towards max_running; the rest wait without taking a slot.
+    """
+
+    def __init__(self, max_running, max_pending=MAX_PENDING_UPDATES):
+        super().__init__(max(max_pending, max_running))
+        self.max_running = max_running
+        self._running = asyncio.Semaphore(max_running)
+        self._locks = {}
+
+    def _keys(self, update):
+        if not isinstance(update, Update):
+            return []
+        keys = []
+        if update.effective_user:
+            keys.append(("user", update.effective_user.id))
+        elif update.effective_chat:
+            keys.append(("chat", update.effective_chat.id))
+        query = update.callback_query
+        if query and query.data and "^^^" in query.data:
+            # Search buttons are cid^^^index^^^op; /ytfillstop buttons have no cid
+            cid = query.data.split("^^^")[0]
+            if cid != "ytfillstop":
+                keys.append(("cid", cid))
+        return keys
+
+    def _retain(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+
+    def _release(self, key):
+        entry = self._locks[key]
+        entry[1] -= 1
+        if not entry[1]:
+            del self._locks[key]
+
+    async def do_process_update(self, update, coroutine):
+        keys = self._keys(update)
+        for key in keys:
+            self._retain(key)
+        try:
+            async with AsyncExitStack() as stack:
+                for key in keys:
+                    await stack.enter_async_context(self._locks[key][0])
+                await stack.enter_async_context(self._running)
+                await coroutine
+        except asyncio.CancelledError:
+            # Cancelled (at shutdown) before its turn came; don't leave the
+            # handler coroutine unawaited
+            if asyncio.iscoroutine(coroutine):
+                coroutine.close()
+            raise
+        finally:
+            for key in keys:
+                self._release(key)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
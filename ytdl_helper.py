@@ -32,32 +32,28 @@ def clean_title(title: str) -> str:
     return re.sub(r"\s+", " ", title).strip(" -|:")
 
 
-def lookup_canonical_movie_name(title: str, radarr, threshold: float = 0.50) -> str | None:
+async def lookup_canonical_movie_name(title: str, radarr, threshold: float = 0.50) -> str | None:
     """Query Radarr/TMDB and return 'Title (Year)' for the best match, or None."""
     clean = clean_title(title)
     try:
-        results = radarr.lookup_movie(clean)
+        results = await radarr.lookup_movie(clean)
     except Exception:
         return None
-    if not results:
-        return None
-    best_score, best = 0.0, None
-    for r in results:
-        score = _similarity(clean, r.get("title", ""))
-        if score > best_score:
-            best_score, best = score, r
-    if best_score >= threshold and best and best.get("year"):
-        return f"{best['title']} ({best['year']})"
-    return None
+    return pick_canonical_name(clean, results, threshold)
 
 
-def lookup_canonical_series_name(title: str, sonarr, threshold: float = 0.50) -> str | None:
+async def lookup_canonical_series_name(title: str, sonarr, threshold: float = 0.50) -> str | None:
     """Query Sonarr/TVDB and return 'Title (Year)' for the best match, or None."""
     clean = clean_title(title)
     try:
-        results = sonarr.lookup_series(clean)
+        results = await sonarr.lookup_series(clean)
     except Exception:
         return None
+    return pick_canonical_name(clean, results, threshold)
+
+
+def pick_canonical_name(clean: str, results: list, threshold: float = 0.50) -> str | None:
+    """Return 'Title (Year)' for the lookup result that best matches a cleaned title."""
     if not results:
         return None
     best_score, best = 0.0, None